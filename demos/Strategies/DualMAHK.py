@@ -5,9 +5,13 @@
 当5日均线上穿10日均线时买入，下穿时卖出
 """
 
-import numpy as np
-import talib
+import logging
+from collections import deque
+
 from wtpy import BaseCtaStrategy, CtaContext
+from _ctx_cache import get_comminfo
+
+logger = logging.getLogger(__name__)
 
 class DualMAHK(BaseCtaStrategy):
     """
@@ -44,11 +48,23 @@ class DualMAHK(BaseCtaStrategy):
         self.__max_pos__ = max_pos
         self.__lot_size__ = lot_size
         
+        # 开仓数量只取决于初始化参数，预先按整手计算好
+        self._trade_lots = max_pos // lot_size
+        self._trade_qty = self._trade_lots * lot_size
+        
         # 状态变量
         self.__last_ma_short__ = 0.0
         self.__last_ma_long__ = 0.0
         self.__last_signal__ = 0  # 0: 无信号, 1: 买入, -1: 卖出
         
+        # 增量均线状态：保存最近ma_long+1根收盘价，维护长短窗口的滚动和
+        self._closes_ring = deque(maxlen=ma_long + 1)
+        self._sum_s = 0.0
+        self._sum_l = 0.0
+        self._prev_ma_s = float('nan')
+        self._prev_ma_l = float('nan')
+        self._warmed_up = False
+        
     @property
     def code(self):
         """获取交易代码"""
@@ -77,31 +93,31 @@ class DualMAHK(BaseCtaStrategy):
             context: 策略上下文
         """
         code = self.__code__
-        print(f"=== 双均线策略初始化开始: {code} ===")
-        print(f"策略参数: MA短期={self.__ma_short__}, MA长期={self.__ma_long__}")
-        print(f"最大持仓: {self.__max_pos__}, 每手股数: {self.__lot_size__}")
+        logger.info("=== 双均线策略初始化开始: %s ===", code)
+        logger.info("策略参数: MA短期=%s, MA长期=%s", self.__ma_short__, self.__ma_long__)
+        logger.info("最大持仓: %s, 每手股数: %s", self.__max_pos__, self.__lot_size__)
         
         # 获取品种信息
-        pInfo = context.stra_get_comminfo(code)
-        print(f"品种信息: {pInfo}")
+        pInfo = get_comminfo(context, code)
+        logger.info("品种信息: %s", pInfo)
         
         # 准备K线数据，这是触发策略计算的关键
-        print(f"准备K线数据: {code}, 周期: {self.__period__}, 条数: {self.__bar_cnt__}")
+        logger.info("准备K线数据: %s, 周期: %s, 条数: %s", code, self.__period__, self.__bar_cnt__)
         context.stra_prepare_bars(code, self.__period__, self.__bar_cnt__, isMain=True)
         
         # 订阅K线事件，确保on_bar被调用
         context.stra_sub_bar_events(code, self.__period__)
-        print(f"订阅K线事件: {code}, 周期: {self.__period__}")
+        logger.info("订阅K线事件: %s, 周期: %s", code, self.__period__)
         
         # 订阅tick数据
         context.stra_sub_ticks(code)
-        print(f"订阅tick数据: {code}")
+        logger.info("订阅tick数据: %s", code)
         
         # 获取并打印初始资金信息
         fund_data = context.stra_get_fund_data(0)  # 0-动态权益
         context.stra_log_text(f"初始资金: {fund_data}")
         
-        print(f"=== 双均线策略初始化完成: {code} ===")
+        logger.info("=== 双均线策略初始化完成: %s ===", code)
         
     def on_tick(self, context: CtaContext, stdCode: str, newTick):
         """
@@ -125,114 +141,143 @@ class DualMAHK(BaseCtaStrategy):
             period: K线周期
             newBar: 新的K线数据
         """
-        print(f"*** on_bar被调用: {stdCode}, 周期: {period}, 时间: {context.stra_get_date()}{context.stra_get_time()} ***")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("on_bar被调用: %s, 周期: %s, 时间: %s%s", stdCode, period, context.stra_get_date(), context.stra_get_time())
         
-        if stdCode != self.__code__:
-            print(f"代码不匹配，跳过: {stdCode} != {self.__code__}")
-            return
-            
-        print(f"代码匹配，开始策略计算: {stdCode}")
-        # 调用策略计算
-        self.on_calculate(context)
+        # 只订阅了一个合约的K线事件，代码必然一致，python -O运行时不做检查
+        assert stdCode == self.__code__, f"代码不匹配: {stdCode} != {self.__code__}"
         
-    def on_calculate(self, context: CtaContext):
+        # 调用策略计算，直接使用回调传入的最新K线
+        self.on_calculate(context, newBar)
+        
+    def _warm_up(self, context: CtaContext, close: float):
         """
-        策略计算主函数
+        用历史K线预热收盘价缓存，只在第一根K线时调用一次
         
         Args:
             context: 策略上下文
+            close: 最新K线收盘价
         """
-        code = self.__code__
-        print(f"双均线策略计算开始: {code}, 当前时间: {context.stra_get_date()}{context.stra_get_time()}")
-        
-        # 获取日K线数据
-        print(f"尝试获取K线数据: {code}, 周期: {self.__period__}, 条数: {self.__ma_long__ + 10}")
-        kline = context.stra_get_bars(code, self.__period__, self.__ma_long__ + 10, isMain=True)
-        
-        if kline is None:
-            print(f"无法获取K线数据: {code}")
+        self._warmed_up = True
+        kline = context.stra_get_bars(self.__code__, self.__period__, self.__ma_long__ + 1, isMain=True)
+        if kline is None or len(kline) == 0:
+            logger.warning("无法获取K线数据，从当前K线开始累积: %s", self.__code__)
+            self._push_close(close)
             return
             
-        print(f"获取到K线数据: {code}, 数据条数: {len(kline)}条")
-        if len(kline) < self.__ma_long__ + 1:
-            print(f"K线数据不足: {code}, 需要{self.__ma_long__ + 1}条，实际{len(kline)}条")
-            return
+        closes = kline.closes
+        for price in closes[:-1]:
+            self._push_close(float(price))
             
-        print(f"K线数据充足，开始计算均线: {code}")
+        # 历史数据足够时，直接得到上一根K线的均线值
+        if len(self._closes_ring) >= self.__ma_long__:
+            self._prev_ma_s = self._sum_s / self.__ma_short__
+            self._prev_ma_l = self._sum_l / self.__ma_long__
+        self._push_close(float(closes[-1]))
         
-        # 获取收盘价数据
-        closes = kline.closes
+    def _push_close(self, close: float):
+        """
+        压入最新收盘价，增量更新长短窗口的滚动和
         
-        # 计算移动平均线
-        ma_short_array = talib.SMA(closes, timeperiod=self.__ma_short__)
-        ma_long_array = talib.SMA(closes, timeperiod=self.__ma_long__)
+        Args:
+            close: 最新收盘价
+        """
+        ring = self._closes_ring
+        if len(ring) >= self.__ma_short__:
+            self._sum_s -= ring[-self.__ma_short__]
+        if len(ring) >= self.__ma_long__:
+            self._sum_l -= ring[-self.__ma_long__]
+        ring.append(close)
+        self._sum_s += close
+        self._sum_l += close
+        
+    def on_calculate(self, context: CtaContext, newBar: dict = None):
+        """
+        策略计算主函数
         
-        # 获取最新的均线值
-        current_ma_short = ma_short_array[-1]
-        current_ma_long = ma_long_array[-1]
-        prev_ma_short = ma_short_array[-2] if len(ma_short_array) >= 2 else 0
-        prev_ma_long = ma_long_array[-2] if len(ma_long_array) >= 2 else 0
+        Args:
+            context: 策略上下文
+            newBar: 最新K线，由on_bar传入；引擎在主K线闭合时直接回调时为None
+        """
+        # 最新K线已经在on_bar中处理过，引擎随后的重算回调不再重复计算
+        if newBar is None:
+            return
+            
+        code = self.__code__
+        debug = logger.isEnabledFor(logging.DEBUG)
         
-        # 检查均线数据有效性
-        if np.isnan(current_ma_short) or np.isnan(current_ma_long):
-            print(f"均线数据无效: {code}, MA{self.__ma_short__}={current_ma_short}, MA{self.__ma_long__}={current_ma_long}")
+        # 首根K线用历史数据预热，之后只压入最新收盘价，不再每根K线拉取历史K线
+        if not self._warmed_up:
+            self._warm_up(context, newBar['close'])
+        else:
+            self._push_close(newBar['close'])
+            
+        ring = self._closes_ring
+        if len(ring) < self.__ma_long__:
+            if debug:
+                logger.debug("K线数据不足: %s, 需要%d条，实际%d条", code, self.__ma_long__, len(ring))
             return
             
-        print(f"均线计算完成: {code}, MA{self.__ma_short__}={current_ma_short:.2f}, MA{self.__ma_long__}={current_ma_long:.2f}")
+        # 每根K线都会用到的上下文方法先绑定到局部变量
+        get_pos = context.stra_get_position
+        get_date = context.stra_get_date
+        log = context.stra_log_text
+        
+        # 由滚动和直接得到最新均线，上一根K线的均线取自上次计算
+        current_ma_short = self._sum_s / self.__ma_short__
+        current_ma_long = self._sum_l / self.__ma_long__
+        prev_ma_short = self._prev_ma_s
+        prev_ma_long = self._prev_ma_l
+        self._prev_ma_s = current_ma_short
+        self._prev_ma_l = current_ma_long
+            
+        if debug:
+            logger.debug("均线计算完成: %s, MA%d=%.2f, MA%d=%.2f", code, self.__ma_short__, current_ma_short, self.__ma_long__, current_ma_long)
         
         # 获取当前价格和持仓
-        current_price = closes[-1]
-        current_pos = context.stra_get_position(code)
-        
-        # 判断均线交叉信号
-        signal = 0
-        
-        # 金叉：短期均线上穿长期均线
-        if (prev_ma_short <= prev_ma_long and current_ma_short > current_ma_long):
-            signal = 1
-            print(f"检测到金叉信号: {code}, MA{self.__ma_short__}({current_ma_short:.2f}) > MA{self.__ma_long__}({current_ma_long:.2f})")
-            
-        # 死叉：短期均线下穿长期均线
-        elif (prev_ma_short >= prev_ma_long and current_ma_short < current_ma_long):
-            signal = -1
-            print(f"检测到死叉信号: {code}, MA{self.__ma_short__}({current_ma_short:.2f}) < MA{self.__ma_long__}({current_ma_long:.2f})")
+        current_price = ring[-1]
+        current_pos = get_pos(code)
+        
+        # 判断均线交叉信号：比较前后两根K线长短均线差值的符号，符号变化即为交叉
+        # 上一根均线尚未就绪时d_prev为NaN，d_prev == d_prev为False，信号为0
+        d_now = current_ma_short - current_ma_long
+        d_prev = prev_ma_short - prev_ma_long
+        sign_now = (d_now > 0) - (d_now < 0)
+        sign_prev = (d_prev > 0) - (d_prev < 0)
+        signal = sign_now * (sign_now != sign_prev) * (d_prev == d_prev)
+        
+        if debug and signal != 0:
+            cross = "金叉" if signal > 0 else "死叉"
+            logger.debug("检测到%s信号: %s, MA%d=%.2f, MA%d=%.2f", cross, code, self.__ma_short__, current_ma_short, self.__ma_long__, current_ma_long)
             
         # 执行交易逻辑
-        print(f"交易逻辑检查: current_pos={current_pos}, signal={signal}")
+        if debug:
+            logger.debug("交易逻辑检查: current_pos=%s, signal=%d", current_pos, signal)
         
         if current_pos == 0:  # 无持仓
             if signal == 1:  # 金叉买入信号
-                lots = self.__max_pos__ // self.__lot_size__
-                print(f"计算买入数量: max_pos={self.__max_pos__}, lot_size={self.__lot_size__}, lots={lots}")
-                if lots > 0:
-                    print(f"准备执行买入操作...")
+                if self._trade_lots > 0:
                     # 执行交易
-                    context.stra_enter_long(code, lots * self.__lot_size__, "ma_cross_buy")
-                    print(f"买入操作已执行: {code}, 数量{lots * self.__lot_size__}")
-                    context.stra_log_text(f"金叉买入: {code}, 价格{current_price:.2f}, 数量{lots * self.__lot_size__}")
-                    print(f"执行买入: {code}, 价格{current_price:.2f}, 数量{lots * self.__lot_size__}")
+                    context.stra_enter_long(code, self._trade_qty, "ma_cross_buy")
+                    log(f"金叉买入: {code}, 价格{current_price:.2f}, 数量{self._trade_qty}")
                     
                     # 验证持仓是否更新
-                    new_pos = context.stra_get_position(code)
-                    print(f"买入后持仓: {new_pos}")
-                else:
-                    print(f"买入数量为0，跳过交易: lots={lots}")
+                    if debug:
+                        logger.debug("买入后持仓: %s", get_pos(code))
+                elif debug:
+                    logger.debug("买入数量为0，跳过交易: lots=%d", self._trade_lots)
                     
         elif current_pos > 0:  # 持有多头
             if signal == -1:  # 死叉卖出信号
-                print(f"当前持仓: {current_pos}, 准备卖出")
-                print(f"准备执行卖出操作...")
                 # 执行交易
                 context.stra_exit_long(code, current_pos, "ma_cross_sell")
-                print(f"卖出操作已执行: {code}, 数量{current_pos}")
-                context.stra_log_text(f"死叉卖出: {code}, 价格{current_price:.2f}, 数量{current_pos}")
-                print(f"执行卖出: {code}, 价格{current_price:.2f}, 数量{current_pos}")
+                log(f"死叉卖出: {code}, 价格{current_price:.2f}, 数量{current_pos}")
                 
                 # 验证持仓是否更新
-                new_pos = context.stra_get_position(code)
-                print(f"卖出后持仓: {new_pos}")
-        else:
-            print(f"无交易条件满足: current_pos={current_pos}, signal={signal}")
+                if debug:
+                    logger.debug("卖出后持仓: %s", get_pos(code))
+        elif debug:
+            logger.debug("无交易条件满足: current_pos=%s, signal=%d", current_pos, signal)
                 
         # 保存状态
         self.__last_ma_short__ = current_ma_short
@@ -240,8 +285,8 @@ class DualMAHK(BaseCtaStrategy):
         self.__last_signal__ = signal
         
         # 输出调试信息（每10个交易日输出一次）
-        if context.stra_get_date() % 10 == 0:
-            context.stra_log_text(
+        if get_date() % 10 == 0:
+            log(
                 f"价格:{current_price:.2f}, MA{self.__ma_short__}:{current_ma_short:.2f}, "
                 f"MA{self.__ma_long__}:{current_ma_long:.2f}, 持仓:{current_pos}, 信号:{signal}"
             )
@@ -6,9 +6,14 @@
 支持腾讯控股等港股标的交易
 """
 
-from wtpy import BaseCtaStrategy, CtaContext
+import logging
+
 import numpy as np
-import talib
+from wtpy import BaseCtaStrategy, CtaContext
+from _dt_numba import dt_kernel, HAS_NUMBA
+from _ctx_cache import get_comminfo
+
+logger = logging.getLogger(__name__)
 
 class StraDualThrustHK(BaseCtaStrategy):
     """
@@ -17,7 +22,7 @@ class StraDualThrustHK(BaseCtaStrategy):
     """
     
     def __init__(self, name: str, code: str, barCnt: int, period: str, days: int, 
-                 k1: float, k2: float, max_pos: int = 1000, stop_loss: float = 0.05):
+                 k1: float, k2: float, max_pos: int = 1000, stop_loss: float = 0.05, dtype=np.float64):
         """
         初始化港股DualThrust策略
         
@@ -31,6 +36,7 @@ class StraDualThrustHK(BaseCtaStrategy):
             k2: 下轨系数
             max_pos: 最大持仓手数
             stop_loss: 止损比例
+            dtype: 指标计算使用的浮点类型，np.float32可以减半内存带宽，但不保证与float64逐位一致，没有numba时忽略
         """
         BaseCtaStrategy.__init__(self, name)
         
@@ -42,11 +48,20 @@ class StraDualThrustHK(BaseCtaStrategy):
         self.__code__ = code
         self.__max_pos__ = max_pos
         self.__stop_loss__ = stop_loss
+        self.__dtype__ = np.dtype(dtype)
+        
+        # 系数与缓冲区类型保持一致，numba按类型选择对应的内核版本
+        self._k1 = self.__dtype__.type(k1)
+        self._k2 = self.__dtype__.type(k2)
         
         # 港股交易参数
         self.__lot_size__ = 100  # 港股每手股数
         self.__min_change__ = 0.01  # 最小价格变动
         
+        # 开仓数量只取决于初始化参数，预先按整手计算好
+        self._trade_lots = max_pos // self.__lot_size__
+        self._trade_qty = self._trade_lots * self.__lot_size__
+        
         # 策略状态变量
         self.__last_entry_price__ = 0.0
         self.__last_signal__ = 0
@@ -89,28 +104,43 @@ class StraDualThrustHK(BaseCtaStrategy):
             context: 策略上下文
         """
         code = self.__code__
-        print(f"策略初始化开始: {code}")
+        logger.info("策略初始化开始: %s", code)
         
         # 获取品种信息
-        pInfo = context.stra_get_comminfo(code)
+        pInfo = get_comminfo(context, code)
         if pInfo is not None:
             context.stra_log_text(f"品种信息: {pInfo}")
-            print(f"品种信息: {pInfo}")
+            logger.info("品种信息: %s", pInfo)
         else:
-            print(f"无法获取品种信息: {code}")
+            logger.warning("无法获取品种信息: %s", code)
             
-        # 准备K线数据
-        context.stra_prepare_bars(code, self.__period__, self.__bar_cnt__, isMain=True)
-        print(f"准备K线数据: {code}, 周期: {self.__period__}, 条数: {self.__bar_cnt__}")
-        
         # 准备K线数据，这是触发策略计算的关键
         context.stra_prepare_bars(code, self.__period__, self.__bar_cnt__, isMain=True)
+        logger.info("准备K线数据: %s, 周期: %s, 条数: %s", code, self.__period__, self.__bar_cnt__)
+        
+        # 订阅K线事件，on_bar中把最新K线写入环形缓冲区
+        context.stra_sub_bar_events(code, self.__period__)
+        # 没有numba时（如PyPy下）内核是纯Python函数，缓冲区用list，逐元素读写比numpy数组快
+        days = self.__days__
+        if HAS_NUMBA:
+            dtype = self.__dtype__
+            self._opens = np.empty(days, dtype=dtype)
+            self._highs = np.empty(days, dtype=dtype)
+            self._lows = np.empty(days, dtype=dtype)
+            self._closes = np.empty(days, dtype=dtype)
+        else:
+            self._opens = [0.0] * days
+            self._highs = [0.0] * days
+            self._lows = [0.0] * days
+            self._closes = [0.0] * days
+        self._head = 0
+        
         # 订阅tick数据
         context.stra_sub_ticks(code)
-        print(f"订阅tick数据: {code}")
+        logger.info("订阅tick数据: %s", code)
         
         context.stra_log_text(f"港股DualThrust策略初始化完成: {code}")
-        print(f"港股DualThrust策略初始化完成: {code}")
+        logger.info("港股DualThrust策略初始化完成: %s", code)
         
         # 读取存储的数据
         self.__last_entry_price__ = context.user_load_data('last_entry_price', 0.0)
@@ -127,6 +157,48 @@ class StraDualThrustHK(BaseCtaStrategy):
         """
         # 可以在这里添加tick级别的逻辑
         pass
+        
+    def on_bar(self, context: CtaContext, stdCode: str, period: str, newBar: dict):
+        """
+        K线闭合回调，把最新K线写入环形缓冲区，指标计算在on_calculate中完成
+        
+        Args:
+            context: 策略上下文
+            stdCode: 标准代码
+            period: K线周期
+            newBar: 最新K线
+        """
+        # 首根K线用历史数据填充缓冲区
+        if self._head == 0:
+            self._warm_up(context)
+            if self._head > 0:
+                return
+                
+        idx = self._head % self.__days__
+        self._opens[idx] = newBar['open']
+        self._highs[idx] = newBar['high']
+        self._lows[idx] = newBar['low']
+        self._closes[idx] = newBar['close']
+        self._head += 1
+        
+    def _warm_up(self, context: CtaContext):
+        """
+        用最近days根历史K线（含最新K线）填充环形缓冲区，只在第一根K线时调用
+        
+        Args:
+            context: 策略上下文
+        """
+        kline = context.stra_get_bars(self.__code__, self.__period__, self.__days__, isMain=True)
+        if kline is None or len(kline) == 0:
+            logger.warning("无法获取K线数据，从当前K线开始累积: %s", self.__code__)
+            return
+            
+        count = min(len(kline), self.__days__)
+        self._opens[:count] = kline.opens[-count:].tolist()
+        self._highs[:count] = kline.highs[-count:].tolist()
+        self._lows[:count] = kline.lows[-count:].tolist()
+        self._closes[:count] = kline.closes[-count:].tolist()
+        self._head = count
     
     def on_calculate(self, context: CtaContext):
         """
@@ -136,55 +208,31 @@ class StraDualThrustHK(BaseCtaStrategy):
             context: 策略上下文
         """
         code = self.__code__
-        print(f"策略计算开始: {code}, 当前时间: {context.stra_get_date()}{context.stra_get_time()}")
+        debug = logger.isEnabledFor(logging.DEBUG)
         
-        # 获取K线数据
-        print(f"尝试获取K线数据: {code}, 周期: {self.__period__}, 天数: {self.__days__}")
-        kline = context.stra_get_bars(code, self.__period__, self.__days__, isMain=True)
-        
-        if kline is None:
-            print(f"无法获取K线数据: {code}")
+        days = self.__days__
+        head = self._head
+        if head < days:
+            if debug:
+                logger.debug("K线数据不足: %s, 需要%d条，实际%d条", code, days, head)
             return
             
-        print(f"获取到K线数据: {code}, 数据条数: {len(kline)}条")
-        if len(kline) < self.__days__:
-            print(f"K线数据不足: {code}, 需要{self.__days__}条，实际{len(kline)}条")
-            return
+        # 每根K线都会用到的上下文方法先绑定到局部变量
+        get_pos = context.stra_get_position
+        get_date = context.stra_get_date
+        log = context.stra_log_text
+        
+        # 打印最新K线用于调试
+        if debug:
+            last = (head - 1) % days
+            logger.debug("最新K线数据: %s, 时间=%s%s, 开盘=%s, 最高=%s, 最低=%s, 收盘=%s", code, get_date(), context.stra_get_time(), 
+                         self._opens[last], self._highs[last], self._lows[last], self._closes[last])
             
-        print(f"K线数据充足，开始计算指标: {code}")
-        # 打印最近几条数据用于调试
-        if len(kline) > 0:
-            print(f"最新K线数据: 时间={kline.times[-1]}, 开盘={kline.opens[-1]}, 最高={kline.highs[-1]}, 最低={kline.lows[-1]}, 收盘={kline.closes[-1]}")
-            
-        # 计算技术指标
-        closes = kline.closes[-self.__days__:]
-        highs = kline.highs[-self.__days__:]
-        lows = kline.lows[-self.__days__:]
-        
-        if len(closes) < self.__days__:
-            return
-            
-        # 计算DualThrust指标
-        hh = np.max(highs[:-1])  # 前N-1天的最高价
-        ll = np.min(lows[:-1])   # 前N-1天的最低价
-        hc = np.max(closes[:-1]) # 前N-1天的最高收盘价
-        lc = np.min(closes[:-1]) # 前N-1天的最低收盘价
-        
-        # 计算波动范围
-        range1 = hh - lc
-        range2 = hc - ll
-        range_val = max(range1, range2)
-        
-        # 计算上下轨
-        current_open = kline.opens[-1]
-        upper_band = current_open + self.__k1__ * range_val
-        lower_band = current_open - self.__k2__ * range_val
-        
-        current_price = closes[-1]
-        current_pos = context.stra_get_position(code)
-        
-        # 添加移动平均线过滤
-        ma20 = talib.SMA(closes, timeperiod=20)[-1] if len(closes) >= 20 else current_price
+        # 在环形缓冲区上计算DualThrust指标及均线过滤，一次遍历完成
+        upper_band, lower_band, ma20, current_price = dt_kernel(
+            self._opens, self._highs, self._lows, self._closes, head,
+            self._k1, self._k2, 20)
+        current_pos = get_pos(code)
         
         # 交易信号逻辑
         signal = 0
@@ -202,11 +250,11 @@ class StraDualThrustHK(BaseCtaStrategy):
             if current_pos > 0:  # 多头持仓
                 if current_price < self.__last_entry_price__ * (1 - self.__stop_loss__):
                     signal = 0  # 止损平仓
-                    context.stra_log_text(f"多头止损: 入场价{self.__last_entry_price__:.2f}, 当前价{current_price:.2f}")
+                    log(f"多头止损: 入场价{self.__last_entry_price__:.2f}, 当前价{current_price:.2f}")
             elif current_pos < 0:  # 空头持仓
                 if current_price > self.__last_entry_price__ * (1 + self.__stop_loss__):
                     signal = 0  # 止损平仓
-                    context.stra_log_text(f"空头止损: 入场价{self.__last_entry_price__:.2f}, 当前价{current_price:.2f}")
+                    log(f"空头止损: 入场价{self.__last_entry_price__:.2f}, 当前价{current_price:.2f}")
         
         # 执行交易
         target_pos = 0
@@ -220,15 +268,14 @@ class StraDualThrustHK(BaseCtaStrategy):
         # 执行交易逻辑
         if current_pos == 0:  # 无持仓
             if signal == 1:  # 做多信号
-                lots = self.__max_pos__ // self.__lot_size__
-                if lots > 0:
-                    context.stra_enter_long(code, lots * self.__lot_size__, "enterlong")
+                if self._trade_lots > 0:
+                    context.stra_enter_long(code, self._trade_qty, "enterlong")
                     self.__last_entry_price__ = current_price
-                    context.stra_log_text(f"多头开仓: 价格{current_price:.2f}, 上轨{upper_band:.2f}, 数量{lots * self.__lot_size__}")
+                    log(f"多头开仓: 价格{current_price:.2f}, 上轨{upper_band:.2f}, 数量{self._trade_qty}")
         elif current_pos > 0:  # 持有多头
             if signal == -1 or signal == 0:  # 平仓信号
                 context.stra_exit_long(code, current_pos, "exitlong")
-                context.stra_log_text(f"多头平仓: 价格{current_price:.2f}, 下轨{lower_band:.2f}, 数量{current_pos}")
+                log(f"多头平仓: 价格{current_price:.2f}, 下轨{lower_band:.2f}, 数量{current_pos}")
                  
         # 保存状态（在有交易时）
         if signal != self.__last_signal__:
@@ -237,8 +284,8 @@ class StraDualThrustHK(BaseCtaStrategy):
             self.__last_signal__ = signal
         
         # 输出调试信息
-        if context.stra_get_date() % 100 == 0:  # 每100个周期输出一次
-            context.stra_log_text(
+        if get_date() % 100 == 0:  # 每100个周期输出一次
+            log(
                 f"价格:{current_price:.2f}, 上轨:{upper_band:.2f}, 下轨:{lower_band:.2f}, "
                 f"MA20:{ma20:.2f}, 持仓:{current_pos}, 信号:{signal}"
             )
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+策略上下文查询结果的缓存
+品种信息按引擎缓存：参数寻优时同一工作进程内的多个策略实例共用一个引擎，只查询一次；
+不同引擎之间互不影响，引擎释放后对应的缓存随之释放
+资金数据随回测进行不断变化，不做缓存
+"""
+
+from weakref import WeakKeyDictionary
+
+from wtpy import CtaContext
+
+# 引擎 -> {合约代码: 品种信息}
+_comminfo_cache = WeakKeyDictionary()
+
+
+def get_comminfo(context: CtaContext, code: str):
+    '''
+    获取品种信息，同一引擎中同一合约只查询一次
+
+    @context    策略上下文
+    @code       合约代码
+    @return     品种信息，引擎中没有该品种时返回None且不缓存
+    '''
+    cache = _comminfo_cache.setdefault(context.__engine__, dict())
+    pInfo = cache.get(code)
+    if pInfo is None:
+        pInfo = context.stra_get_comminfo(code)
+        if pInfo is not None:
+            cache[code] = pInfo
+    return pInfo
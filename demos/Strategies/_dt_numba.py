@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+DualThrust指标计算内核
+安装了numba时编译为本地代码，没有安装时退化为普通的Python函数，
+纯Python版本对list同样适用，可以在PyPy下由其JIT优化
+
+内核声明了显式签名，numba会在模块导入时完成编译，
+配合cache=True将编译结果缓存到__pycache__，避免回测第一根K线时才触发JIT
+同时编译float64和float32两个版本，由传入的缓冲区类型决定使用哪个
+"""
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        '''
+        numba不可用时的替代装饰器，直接返回原函数
+        同时兼容@njit和@njit(...)两种写法
+        '''
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
+
+
+# 开高低收为float64环形缓冲区，环形缓冲区写入位置为int64，k1/k2为float64，均线周期为int64
+DT_KERNEL_SIG = 'UniTuple(f8,4)(f8[:],f8[:],f8[:],f8[:],i8,f8,f8,i8)'
+# float32版本，缓冲区和k1/k2为float32，内存带宽减半
+DT_KERNEL_SIG_F4 = 'UniTuple(f4,4)(f4[:],f4[:],f4[:],f4[:],i8,f4,f4,i8)'
+
+
+@njit([DT_KERNEL_SIG, DT_KERNEL_SIG_F4], cache=True, fastmath=True)
+def dt_kernel(opens, highs, lows, closes, head, k1, k2, w):
+    '''
+    一次遍历计算DualThrust的上下轨和均线
+
+    四个序列是长度相同的环形缓冲区，head为下一次写入的位置，
+    即head处为最早的K线，head-1处为当前K线
+
+    @opens      开盘价环形缓冲区
+    @highs      最高价环形缓冲区
+    @lows       最低价环形缓冲区
+    @closes     收盘价环形缓冲区
+    @head       环形缓冲区的写入位置，可以是未取模的累计写入次数
+    @k1         上轨系数
+    @k2         下轨系数
+    @w          均线周期，数据不足w条时均线取当前价
+    @return     (上轨, 下轨, 均线, 当前价)
+    '''
+    n = len(closes)
+    head = head % n
+    last = head - 1 if head > 0 else n - 1
+    price = closes[last]
+
+    # 前N-1根K线的最高价、最低价、最高收盘价、最低收盘价，按时间顺序从最早的K线开始
+    hh = highs[head]
+    ll = lows[head]
+    hc = closes[head]
+    lc = closes[head]
+    ma_sum = 0.0
+    i = head
+    for j in range(n - 1):
+        if highs[i] > hh:
+            hh = highs[i]
+        if lows[i] < ll:
+            ll = lows[i]
+        if closes[i] > hc:
+            hc = closes[i]
+        if closes[i] < lc:
+            lc = closes[i]
+        if j >= n - w:
+            ma_sum += closes[i]
+        i += 1
+        if i == n:
+            i = 0
+
+    range_val = max(hh - lc, hc - ll)
+    current_open = opens[last]
+    upper = current_open + k1 * range_val
+    lower = current_open - k2 * range_val
+
+    if n >= w:
+        ma = (ma_sum + price) / w
+    else:
+        ma = price
+
+    return upper, lower, ma, price
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+双均线和DualThrust策略的向量化模拟器
+不经过回测引擎的逐K线回调，用numpy一次算出全部信号和持仓，
+适合参数寻优时快速筛选参数，选出的参数再用WtBtEngine完整回测确认
+
+与引擎回测的差异：
+1. 按信号K线的收盘价成交，不计手续费和滑点
+2. DualThrust的止损依赖入场价，属于路径相关逻辑，这里不做模拟
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import bottleneck as bn
+except ImportError:
+    bn = None
+
+
+def _rolling_mean(close: pd.Series, window: int) -> np.ndarray:
+    '''
+    滚动均线，不足window条的位置为NaN
+    安装了bottleneck时使用move_mean，否则退化为pandas的rolling
+    '''
+    if bn is not None:
+        return bn.move_mean(close.values, window=window, min_count=window)
+    return close.rolling(window).mean().values
+
+
+def _signals_to_position(signal: np.ndarray, qty: int) -> np.ndarray:
+    '''
+    由信号序列生成持仓，逻辑与策略中的交易逻辑一致：空仓遇买入信号开仓，持仓遇卖出信号平仓
+    买入信号处持仓为qty，卖出信号处为0，其余位置沿用前一根K线的持仓，全程没有python循环
+
+    @signal     信号序列，1为买入，-1为卖出，0为无信号
+    @qty        开仓数量
+    @return     每根K线收盘后的持仓
+    '''
+    position = np.where(signal == 1, qty, np.where(signal == -1, 0, np.nan))
+    return pd.Series(position).ffill().fillna(0).values.astype(np.int64)
+
+
+def _make_result(close: pd.Series, signal: np.ndarray, position: np.ndarray) -> pd.DataFrame:
+    '''
+    由持仓计算逐K线盈亏和资金曲线，当前K线的盈亏由上一根K线收盘后的持仓产生
+    '''
+    position = pd.Series(position, index=close.index)
+    pnl = (close.diff() * position.shift()).fillna(0.0)
+    return pd.DataFrame({
+        'close': close,
+        'signal': signal,
+        'position': position,
+        'pnl': pnl,
+        'dynbalance': pnl.cumsum()
+    })
+
+
+def backtest_dualma(ohlc: pd.DataFrame, s: int, l: int, max_pos: int = 1000, lot_size: int = 100) -> pd.DataFrame:
+    """
+    向量化模拟双均线策略
+
+    Args:
+        ohlc: K线数据，至少包含close列
+        s: 短期均线周期
+        l: 长期均线周期
+        max_pos: 最大持仓股数
+        lot_size: 每手股数
+
+    Returns:
+        DataFrame: 逐K线的收盘价、信号、持仓、盈亏和累计盈亏(dynbalance)
+    """
+    close = ohlc['close'].astype(float)
+    ma_s = _rolling_mean(close, s)
+    ma_l = _rolling_mean(close, l)
+
+    # 均线差值的符号变化即为交叉：diff为+2/+1且当前符号为正是金叉，-2/-1且当前符号为负是死叉
+    # 变为0不算交叉，均线未就绪时为NaN不产生信号
+    cross = np.sign(ma_s - ma_l)
+    diff_sign = np.diff(cross, prepend=np.nan)
+    long_entries = (diff_sign > 0) & (cross > 0)
+    long_exits = (diff_sign < 0) & (cross < 0)
+    signal = long_entries.astype(np.int64) - long_exits.astype(np.int64)
+
+    position = _signals_to_position(signal, (max_pos // lot_size) * lot_size)
+    return _make_result(close, signal, position)
+
+
+def backtest_dualthrust(ohlc: pd.DataFrame, days: int, k1: float, k2: float, max_pos: int = 1000,
+                        lot_size: int = 100, ma_period: int = 20) -> pd.DataFrame:
+    """
+    向量化模拟DualThrust策略（不含止损）
+
+    Args:
+        ohlc: K线数据，包含open、high、low、close列
+        days: 算法引用的K线条数，含当前K线
+        k1: 上轨系数
+        k2: 下轨系数
+        max_pos: 最大持仓股数
+        lot_size: 每手股数
+        ma_period: 均线过滤周期
+
+    Returns:
+        DataFrame: 逐K线的收盘价、信号、持仓、盈亏和累计盈亏(dynbalance)
+    """
+    close = ohlc['close'].astype(float)
+    open_ = ohlc['open'].astype(float).values
+
+    # 当前K线之前days-1根K线的最高价、最低价、最高收盘价、最低收盘价
+    win = days - 1
+    hh = ohlc['high'].astype(float).rolling(win).max().shift().values
+    ll = ohlc['low'].astype(float).rolling(win).min().shift().values
+    hc = close.rolling(win).max().shift().values
+    lc = close.rolling(win).min().shift().values
+    range_val = np.maximum(hh - lc, hc - ll)
+    upper = open_ + k1 * range_val
+    lower = open_ - k2 * range_val
+
+    # 数据不足均线周期时均线取当前价
+    price = close.values
+    ma = _rolling_mean(close, ma_period)
+    if days < ma_period:
+        ma = price
+
+    long_sig = (price > upper) & (price > ma)
+    short_sig = (price < lower) & (price < ma)
+    signal = long_sig.astype(np.int64) - short_sig.astype(np.int64)
+
+    # 持有多头时，没有做多信号即平仓
+    exit_sig = np.where(signal == 1, 1, -1)
+    exit_sig[np.isnan(range_val)] = 0
+    position = _signals_to_position(exit_sig, (max_pos // lot_size) * lot_size)
+    return _make_result(close, signal, position)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+港股回测脚本共用的引擎、数据加载器和多进程参数寻优逻辑
+各回测脚本只需提供策略类、默认参数和参数网格
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+
+import numpy as np
+
+from wtpy import WtBtEngine, EngineType
+from wtpy.WtCoreDefs import WTSBarStruct
+from wtpy.WtDataDefs import NpTypeBar
+from wtpy.futu import FutuDataLoader, CachedFutuDataLoader
+
+# WtBtEngine是进程内单例，每个进程只创建一次引擎和数据加载器，多组参数复用
+_engine = None
+_futu_loader = None
+
+# 参数寻优时由主进程放入共享内存的K线，工作进程通过_init_worker挂载
+_shared_bars = None
+
+class SharedBarsLoader(FutuDataLoader):
+    """
+    从共享内存读取K线的数据加载器
+    主进程只拉取一次K线，各工作进程直接把共享内存中的WTSBarStruct数组交给引擎，不再各自复制一份
+    """
+
+    def __init__(self, shm_name: str, shape: tuple, dtype: np.dtype, code: str, period: str):
+        """
+        挂载主进程创建的共享内存
+
+        Args:
+            shm_name: 共享内存名称
+            shape: K线数组的形状
+            dtype: K线数组的类型，与WTSBarStruct内存布局一致
+            code: 共享K线对应的合约代码
+            period: 共享K线对应的周期
+        """
+        super().__init__()
+        # 共享内存对象需要一直持有，否则视图对应的内存会被释放
+        self.__shm__ = SharedMemory(name=shm_name)
+        self.__bars__ = np.ndarray(shape, dtype=dtype, buffer=self.__shm__.buf)
+        self.__code__ = code
+        self.__period__ = period
+
+    def load_final_his_bars(self, stdCode: str, period: str, feeder) -> bool:
+        """
+        共享的合约和周期直接从共享内存喂给引擎，其他请求走富途接口
+        """
+        if stdCode != self.__code__ or period != self.__period__:
+            return super().load_final_his_bars(stdCode, period, feeder)
+
+        # 零拷贝地把共享内存解释为WTSBarStruct数组，引擎只读取不修改
+        count = len(self.__bars__)
+        bars = (WTSBarStruct * count).from_buffer(self.__bars__)
+        feeder(bars, count)
+        return True
+
+    def close(self):
+        """
+        断开共享内存，共享内存由主进程负责释放
+        """
+        self.__bars__ = None
+        self.__shm__.close()
+        super().close()
+
+def _bt_date(bt_time: int) -> str:
+    """
+    把回测配置的时间YYYYMMDDHHMM转换为K线请求使用的日期 'YYYY-MM-DD'
+    """
+    s = str(bt_time)
+    return f"{s[0:4]}-{s[4:6]}-{s[6:8]}"
+
+def create_loader(bt_start: int, bt_end: int) -> CachedFutuDataLoader:
+    """
+    创建并初始化带本地缓存的富途数据加载器
+    历史K线的请求范围与回测配置一致，缓存文件不随运行日期变化，重复运行时不再从OpenD拉取相同的K线
+
+    Args:
+        bt_start: 回测开始时间，YYYYMMDDHHMM
+        bt_end: 回测结束时间，YYYYMMDDHHMM
+    """
+    futu_loader = CachedFutuDataLoader(host='127.0.0.1', port=11111, cache_dir='./cache',
+                                       start_date=_bt_date(bt_start), end_date=_bt_date(bt_end))
+    if not futu_loader.init():
+        raise RuntimeError("富途数据加载器初始化失败，请检查富途OpenD服务")
+    return futu_loader
+
+def share_bars(code: str, period: str, bt_start: int, bt_end: int) -> tuple:
+    """
+    在主进程中拉取一次K线并复制到共享内存
+
+    Args:
+        code: 合约代码
+        period: K线周期
+        bt_start: 回测开始时间，YYYYMMDDHHMM
+        bt_end: 回测结束时间，YYYYMMDDHHMM
+
+    Returns:
+        tuple: (保存K线的共享内存, K线数组形状)，共享内存使用完后需要close和unlink
+    """
+    futu_loader = create_loader(bt_start, bt_end)
+
+    # 借用load_final_his_bars的取数逻辑，保证与单进程回测使用的K线一致
+    loaded = []
+    def capture(bars, count):
+        loaded.append(np.frombuffer(bars, dtype=NpTypeBar, count=count))
+
+    try:
+        if not futu_loader.load_final_his_bars(code, period, capture):
+            raise RuntimeError(f"拉取K线失败: {code}, {period}")
+    finally:
+        futu_loader.close()
+
+    arr = loaded[0]
+    shm = SharedMemory(create=True, size=arr.nbytes)
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm, arr.shape
+
+def get_engine(bt_start: int, bt_end: int) -> WtBtEngine:
+    """
+    获取当前进程的回测引擎，第一次调用时完成初始化
+
+    Args:
+        bt_start: 回测开始时间，YYYYMMDDHHMM
+        bt_end: 回测结束时间，YYYYMMDDHHMM
+    """
+    global _engine, _futu_loader
+    if _engine is not None:
+        return _engine
+
+    engine = WtBtEngine(EngineType.ET_CTA)
+    config_dir = os.path.dirname(os.path.abspath(__file__))
+    config_file = os.path.join(config_dir, "configbt.yaml")
+    engine.init(config_dir, config_file)
+    engine.configBacktest(bt_start, bt_end)
+
+    if _shared_bars is not None:
+        # 参数寻优的工作进程直接使用主进程放入共享内存的K线
+        futu_loader = SharedBarsLoader(*_shared_bars)
+    else:
+        futu_loader = create_loader(bt_start, bt_end)
+
+    # 设置数据加载器，bAutoTrans=False表示不自动转换数据格式
+    engine.set_extended_data_loader(futu_loader, bAutoTrans=False)
+    engine.commitBTConfig()
+
+    _engine = engine
+    _futu_loader = futu_loader
+    return _engine
+
+def close_loader():
+    """
+    关闭当前进程的富途数据连接
+    """
+    if _futu_loader is not None:
+        _futu_loader.close()
+
+def release_engine():
+    """
+    关闭当前进程的数据连接并释放回测框架，工作进程退出时调用
+    """
+    close_loader()
+    if _engine is not None:
+        _engine.release_backtest()
+
+def _init_worker(shared_bars: tuple):
+    """
+    工作进程初始化，记录共享K线的描述信息，引擎在第一次回测时创建
+    工作进程以os._exit退出，不会执行atexit，退出时的清理通过Finalize注册
+    """
+    global _shared_bars
+    _shared_bars = shared_bars
+    Finalize(None, release_engine, exitpriority=10)
+
+def run_one(strategy_cls, bt_start: int, bt_end: int, params: dict) -> dict:
+    """
+    用一组参数运行一次回测
+
+    Args:
+        strategy_cls: 策略类
+        bt_start: 回测开始时间，YYYYMMDDHHMM
+        bt_end: 回测结束时间，YYYYMMDDHHMM
+        params: 策略的构造参数，name决定输出目录./outputs_bt/{name}/
+
+    Returns:
+        dict: 策略名称、参数和资金曲线文件路径
+    """
+    engine = get_engine(bt_start, bt_end)
+    engine.set_cta_strategy(strategy_cls(**params))
+    engine.run_backtest()
+
+    name = params['name']
+    return {
+        'name': name,
+        'params': params,
+        'funds': os.path.join('./outputs_bt', name, 'funds.csv')
+    }
+
+def run_sweep(strategy_cls, param_grid: list, bt_start: int, bt_end: int,
+              max_workers: int = None, share: bool = False) -> list:
+    """
+    多进程并行回测一组参数，每个工作进程持有自己的引擎
+
+    Args:
+        strategy_cls: 策略类
+        param_grid: 参数组列表
+        bt_start: 回测开始时间，YYYYMMDDHHMM
+        bt_end: 回测结束时间，YYYYMMDDHHMM
+        max_workers: 最大进程数，默认为CPU核数
+        share: 是否由主进程拉取一次K线放入共享内存，工作进程共用同一份数据；
+               各组参数的code和period必须相同
+
+    Returns:
+        list: 每组参数的回测结果，顺序与param_grid一致
+    """
+    shm = None
+    shared_bars = None
+    if share:
+        code = param_grid[0]['code']
+        period = param_grid[0]['period']
+        shm, shape = share_bars(code, period, bt_start, bt_end)
+        shared_bars = (shm.name, shape, NpTypeBar, code, period)
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                 initializer=_init_worker, initargs=(shared_bars,)) as executor:
+            return list(executor.map(partial(run_one, strategy_cls, bt_start, bt_end), param_grid))
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
@@ -5,14 +5,45 @@
 使用富途OpenAPI数据源进行港股回测
 """
 
-from wtpy import WtBtEngine, EngineType
 from wtpy.apps import WtBtAnalyst
 
+import itertools
+import logging
 import sys
 import os
+
+from _bt_runner import get_engine, close_loader, run_one, run_sweep
 sys.path.append(os.path.join(os.path.dirname(__file__), '../Strategies'))
 from DualThrustHK import StraDualThrustHK
 
+# 回测时间范围（港股交易时间），2023年1月1日到2025年12月31日
+BT_START_TIME = 202301010930
+BT_END_TIME = 202512311600
+
+# 腾讯控股DualThrust策略的默认参数
+DEFAULT_PARAMS = dict(
+    name='dt_tencent',      # 策略实例名称
+    code='HK.00700',        # 腾讯控股代码
+    barCnt=50000,           # 要拉取的K线条数
+    period='m1',            # 使用1分钟K线
+    days=30,                # 算法引用的历史数据条数
+    k1=0.7,                 # 上边界系数
+    k2=0.7,                 # 下边界系数
+    max_pos=1000,           # 最大持仓股数
+    stop_loss=0.05          # 止损比例5%
+)
+
+def make_param_grid(days_list: list, k1_list: list, k2_list: list) -> list:
+    """
+    生成参数网格，每组参数使用不同的策略名称，避免输出文件冲突
+    """
+    param_grid = []
+    for days, k1, k2 in itertools.product(days_list, k1_list, k2_list):
+        params = DEFAULT_PARAMS.copy()
+        params.update(name=f"dt_tencent_{days}_{k1}_{k2}", days=days, k1=k1, k2=k2)
+        param_grid.append(params)
+    return param_grid
+
 def analyze_with_pyfolio(fund_filename: str, capital: float = 500000):
     """
     使用pyfolio进行回测结果分析
@@ -45,52 +76,37 @@ def analyze_with_pyfolio(fund_filename: str, capital: float = 500000):
         print("请安装pyfolio: pip install pyfolio")
 
 if __name__ == "__main__":
-    # 创建一个运行环境，并加入策略
-    engine = WtBtEngine(EngineType.ET_CTA)
-    config_dir = os.path.dirname(os.path.abspath(__file__))
-    config_file = os.path.join(config_dir, "configbt.yaml")
-    engine.init(config_dir, config_file)
-    
-    # 配置回测时间范围（港股交易时间）
-    # 2023年1月1日到2025年12月31日
-    engine.configBacktest(202301010930, 202512311600)
-    #engine.configBTStorage(mode="csv", path="../storage/")
-
-    # 添加富途数据加载器
-    from wtpy.futu import FutuDataLoader
-    futu_loader = FutuDataLoader(host='127.0.0.1', port=11111)
-    if futu_loader.init():
-        # 设置数据加载器，bAutoTrans=False表示不自动转换数据格式
-        engine.set_extended_data_loader(futu_loader, bAutoTrans=False)
+    # 策略逐K线的调试日志默认关闭，需要排查时改为logging.DEBUG
+    logging.basicConfig(level=logging.WARNING)
+
+    if "--sweep" in sys.argv:
+        # 参数寻优：days∈[10..60]，k1/k2∈[0.3..1.0]
+        param_grid = make_param_grid(
+            days_list=[10, 20, 30, 40, 50, 60],
+            k1_list=[0.3, 0.5, 0.7, 1.0],
+            k2_list=[0.3, 0.5, 0.7, 1.0])
+        print(f"开始参数寻优，共{len(param_grid)}组参数...")
+        # K线由主进程拉取一次放入共享内存，工作进程共用同一份数据
+        for result in run_sweep(StraDualThrustHK, param_grid, BT_START_TIME, BT_END_TIME, share=True):
+            print(f"{result['name']}: {result['funds']}")
+        sys.exit(0)
+
+    # 创建一个运行环境，并加入富途数据加载器
+    try:
+        get_engine(BT_START_TIME, BT_END_TIME)
         print("富途数据加载器初始化成功")
-    else:
-        print("富途数据加载器初始化失败，请检查富途OpenD服务")
-        exit(1)
-    
-    engine.commitBTConfig()
-
-    # 创建腾讯控股DualThrust策略实例
-    straInfo = StraDualThrustHK(
-        name='dt_tencent',      # 策略实例名称
-        code='HK.00700',       # 腾讯控股代码
-        barCnt=50000,          # 要拉取的K线条数
-        period='m1',           # 使用5分钟K线
-        days=30,               # 算法引用的历史数据条数
-        k1=0.7,                # 上边界系数
-        k2=0.7,                # 下边界系数
-        max_pos=1000,          # 最大持仓股数
-        stop_loss=0.05         # 止损比例5%
-    )
-    engine.set_cta_strategy(straInfo)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
 
     try:
         # 运行回测
         print("开始运行回测...")
         print(f"回测标的: 腾讯控股 (HK.00700)")
         print(f"回测时间: 2023-01-01 09:30 至 2025-12-31 16:00")
-        print(f"策略参数: days={straInfo.days}, k1={straInfo.k1}, k2={straInfo.k2}")
+        print(f"策略参数: days={DEFAULT_PARAMS['days']}, k1={DEFAULT_PARAMS['k1']}, k2={DEFAULT_PARAMS['k2']}")
         
-        engine.run_backtest()
+        run_one(StraDualThrustHK, BT_START_TIME, BT_END_TIME, DEFAULT_PARAMS)
         print("回测运行完成！")
 
         # 分析回测结果
@@ -115,5 +131,5 @@ if __name__ == "__main__":
     finally:
         # 确保关闭富途连接
         print("\n正在关闭富途数据连接...")
-        futu_loader.close()
-        print("富途数据连接已关闭")
\ No newline at end of file
+        close_loader()
+        print("富途数据连接已关闭")
@@ -5,78 +5,81 @@
 回测腾讯控股最近2年的数据
 """
 
+import itertools
+import logging
 import sys
 import os
-from datetime import datetime, timedelta
 
 # 添加wtpy路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
-from wtpy import WtBtEngine, EngineType
 from wtpy.apps import WtBtAnalyst
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from Strategies.DualMAHK import DualMAHK
-from wtpy.futu import FutuDataLoader
+from _bt_runner import get_engine, close_loader, run_one, run_sweep
+sys.path.append(os.path.join(os.path.dirname(__file__), '../Strategies'))
+from DualMAHK import DualMAHK
+
+# 回测时间范围（港股交易时间），2023年1月1日到2025年6月21日
+BT_START_TIME = 202301010930
+BT_END_TIME = 202506211600
+
+# 双均线策略的默认参数
+DEFAULT_PARAMS = dict(
+    name='dual_ma_tencent',     # 策略实例名称
+    code='HK.00700',            # 腾讯控股代码
+    barCnt=50000,               # 要拉取的K线条数
+    period='d',                 # 使用日K线
+    ma_short=5,                 # 短期均线
+    ma_long=10,                 # 长期均线
+    max_pos=1000,               # 最大持仓股数
+    lot_size=100                # 每手股数
+)
+
+def make_param_grid(short_list: list, long_list: list) -> list:
+    """
+    生成参数网格，跳过短期不小于长期的组合，每组参数使用不同的策略名称
+    """
+    param_grid = []
+    for ma_short, ma_long in itertools.product(short_list, long_list):
+        if ma_short >= ma_long:
+            continue
+        params = DEFAULT_PARAMS.copy()
+        params.update(name=f"dual_ma_tencent_{ma_short}_{ma_long}", ma_short=ma_short, ma_long=ma_long)
+        param_grid.append(params)
+    return param_grid
 
 def main():
     """
     主函数：运行双均线策略回测
     """
     print("=== 开始港股双均线策略回测 ===")
-    
-    # 初始化富途数据加载器
+
+    # 初始化富途数据加载器和回测引擎
     print("初始化富途数据加载器...")
-    futu_loader = FutuDataLoader(host='127.0.0.1', port=11111)
-    if not futu_loader.init():
-        print("富途数据加载器初始化失败！")
+    try:
+        get_engine(BT_START_TIME, BT_END_TIME)
+    except RuntimeError as e:
+        print(e)
         return
     print("富途数据加载器初始化成功")
-    
+
     try:
-        # 创建回测引擎
-        engine = WtBtEngine(EngineType.ET_CTA)
-        config_dir = os.path.dirname(os.path.abspath(__file__))
-        config_file = os.path.join(config_dir, "configbt.yaml")  # 使用基础配置文件
-        engine.init(config_dir, config_file)
-        
-        # 配置回测时间范围（港股交易时间）
-        engine.configBacktest(202301010930, 202506211600)
-        
-        # 设置外部数据加载器
-        engine.set_extended_data_loader(futu_loader, bAutoTrans=False)
-        
-        engine.commitBTConfig()
-        
-        # 创建双均线策略实例
-        strategy = DualMAHK(
-            name='dual_ma_tencent',    # 策略实例名称
-            code='HK.00700',          # 腾讯控股代码
-            barCnt=50000,             # 要拉取的K线条数
-            period='d',               # 使用日K线
-            ma_short=5,               # 短期均线
-            ma_long=10,               # 长期均线
-            max_pos=1000,             # 最大持仓股数
-            lot_size=100              # 每手股数
-        )
-        engine.set_cta_strategy(strategy)
-        
         print("开始运行回测...")
         print(f"回测标的: 腾讯控股 (HK.00700)")
         print(f"回测时间: 2023-01-01 至 2025-06-21 (最近2年)")
-        print(f"策略参数: MA短期={strategy.ma_short}, MA长期={strategy.ma_long}")
-        
+        print(f"策略参数: MA短期={DEFAULT_PARAMS['ma_short']}, MA长期={DEFAULT_PARAMS['ma_long']}")
+
         # 运行回测
-        engine.run_backtest()
-        
+        run_one(DualMAHK, BT_START_TIME, BT_END_TIME, DEFAULT_PARAMS)
+
         print("回测运行完成！")
-        
+
         # 分析回测结果
         print("开始分析回测结果...")
         analyst = WtBtAnalyst()
         analyst.add_strategy('dual_ma_tencent', folder="./outputs_bt/", init_capital=1000000, rf=0.02, annual_trading_days=250)
         analyst.run_new()
         print("回测结果分析完成！")
-        
+
         print("\n=== 腾讯控股双均线策略回测完成！ ===")
         print("回测结果保存在 ./outputs_bt/dual_ma_tencent/ 目录下")
         print("可以查看以下文件：")
@@ -84,17 +87,27 @@ def main():
         print("- trades.csv: 交易记录")
         print("- closes.csv: 平仓记录")
         print("- signals.csv: 信号记录")
-        
+
     except Exception as e:
         print(f"回测过程中发生错误: {e}")
         import traceback
         traceback.print_exc()
-        
+
     finally:
         # 关闭富途数据连接
         print("\n正在关闭富途数据连接...")
-        futu_loader.close()
+        close_loader()
         print("富途数据连接已关闭")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 策略逐K线的调试日志默认关闭，需要排查时改为logging.DEBUG
+    logging.basicConfig(level=logging.WARNING)
+
+    if "--sweep" in sys.argv:
+        # 参数寻优：短期均线3~10，长期均线10~60
+        param_grid = make_param_grid(short_list=[3, 5, 8, 10], long_list=[10, 20, 30, 60])
+        print(f"开始参数寻优，共{len(param_grid)}组参数...")
+        for result in run_sweep(DualMAHK, param_grid, BT_START_TIME, BT_END_TIME):
+            print(f"{result['name']}: {result['funds']}")
+    else:
+        main()
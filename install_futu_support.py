@@ -9,20 +9,21 @@ import subprocess
 import sys
 import os
 
-def install_package(package_name):
+def install_packages(package_names):
     """
-    安装Python包
+    用一次pip调用安装多个Python包，依赖解析只进行一次
     
     Args:
-        package_name: 包名
+        package_names: 包名列表
     """
     try:
-        print(f"正在安装 {package_name}...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
-        print(f"✓ {package_name} 安装成功")
+        print(f"正在安装 {' '.join(package_names)}...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install",
+                               "--upgrade-strategy=only-if-needed", *package_names])
+        print(f"✓ {', '.join(package_names)} 安装成功")
         return True
     except subprocess.CalledProcessError as e:
-        print(f"✗ {package_name} 安装失败: {e}")
+        print(f"✗ {', '.join(package_names)} 安装失败: {e}")
         return False
 
 def check_package(package_name):
@@ -54,12 +55,15 @@ def main():
         ("futu-api", "futu"),  # (pip包名, import名)
         ("numpy", "numpy"),
         ("pandas", "pandas"),
-        ("talib-binary", "talib"),  # 使用二进制版本避免编译问题
     ]
     
     # 可选的包列表
     optional_packages = [
         ("pyfolio", "pyfolio"),
+        ("bottleneck", "bottleneck"),  # 加速滚动均线计算，未安装时使用pandas的rolling
+        ("pyarrow", "pyarrow"),  # 历史K线本地缓存和时间字符串解析
+        ("ciso8601", "ciso8601"),  # 加速富途时间字符串解析
+        ("numba", "numba"),  # 编译时间打包和指标计算内核
         ("matplotlib", "matplotlib"),
         ("seaborn", "seaborn"),
         ("jupyter", "jupyter"),
@@ -83,21 +87,21 @@ def main():
             print(f"✗ {import_name} 未安装")
             missing_optional.append(pip_name)
     
-    # 安装缺失的必需包
-    if missing_required:
-        print(f"\n安装缺失的必需依赖: {', '.join(missing_required)}")
-        for package in missing_required:
-            if not install_package(package):
-                print(f"错误: 无法安装必需依赖 {package}")
-                return False
-    
-    # 询问是否安装可选包
+    # 先询问是否安装可选包，再把需要安装的包合并到一次pip调用中
+    install_optional = False
     if missing_optional:
         print(f"\n发现缺失的可选依赖: {', '.join(missing_optional)}")
         response = input("是否安装可选依赖？(y/n): ").lower().strip()
-        if response in ['y', 'yes', '是']:
-            for package in missing_optional:
-                install_package(package)
+        install_optional = response in ['y', 'yes', '是']
+    
+    packages = missing_required + (missing_optional if install_optional else [])
+    if packages:
+        print(f"\n安装缺失的依赖: {', '.join(packages)}")
+        if not install_packages(packages) and missing_required:
+            # 可选依赖安装失败不影响使用，合并安装失败时单独重试必需依赖
+            if not (install_optional and install_packages(missing_required)):
+                print(f"错误: 无法安装必需依赖 {', '.join(missing_required)}")
+                return False
     
     print("\n" + "=" * 60)
     print("安装完成！")
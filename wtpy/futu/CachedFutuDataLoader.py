@@ -0,0 +1,142 @@
+import os
+import glob
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from .FutuDataLoader import FutuDataLoader
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+class CachedFutuDataLoader(FutuDataLoader):
+    """
+    带本地parquet缓存的富途历史数据加载器
+    相同的(代码, 周期, 起止日期, 条数)请求只访问一次OpenD，之后直接读取缓存文件
+    结束日期为今天或之后的请求可能包含未收盘的K线，不写入缓存
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 11111, cache_dir: str = './cache',
+                 start_date: str = None, end_date: str = None, max_files: int = 64):
+        """
+        初始化带缓存的富途数据加载器
+
+        Args:
+            host: 富途OpenD服务器地址
+            port: 富途OpenD服务器端口
+            cache_dir: 缓存文件目录
+            start_date: load_final_his_bars的开始日期，格式 'YYYY-MM-DD'，一般取回测配置的开始日期
+            end_date: load_final_his_bars的结束日期，格式 'YYYY-MM-DD'，一般取回测配置的结束日期
+            max_files: 缓存目录中最多保留的文件数，超出时删除最久未使用的文件
+        """
+        super().__init__(host, port)
+        self.__cache_dir__ = cache_dir
+        self.__start_date__ = start_date
+        self.__end_date__ = end_date
+        self.__max_files__ = max_files
+        self.__logger__ = logging.getLogger("CachedFutuDataLoader")
+        if pq is None:
+            self.__logger__.warning("未安装pyarrow，K线缓存不可用: pip install pyarrow")
+
+    def _cache_path(self, code: str, period: str, start_date: str, end_date: str, count: int) -> str:
+        """
+        根据请求参数生成缓存文件路径
+        """
+        filename = f"{code}_{period}_{start_date}_{end_date}_{count}.parquet"
+        return os.path.join(self.__cache_dir__, filename)
+
+    def _final_bars_range(self) -> Tuple[str, str]:
+        """
+        load_final_his_bars请求的时间范围
+        优先使用配置的起止日期；未配置时取截止到昨天（最近一个已收盘交易日之前）的2年，
+        同一天内重复运行使用同一个缓存文件，且不会缓存未收盘的K线
+        """
+        if self.__start_date__ and self.__end_date__:
+            return self.__start_date__, self.__end_date__
+
+        end = datetime.now() - timedelta(days=1)
+        return (end - timedelta(days=730)).strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    def _cacheable(self, end_date: str) -> bool:
+        """
+        结束日期早于今天的范围才写入缓存，包含今天的K线还会变化；未指定结束日期表示截止到当前，同样不缓存
+        """
+        return pq is not None and bool(end_date) and end_date < datetime.now().strftime('%Y-%m-%d')
+
+    def _evict_files(self):
+        """
+        缓存文件超过max_files时，按最后使用时间删除最旧的文件
+        """
+        files = glob.glob(os.path.join(self.__cache_dir__, "*.parquet"))
+        if len(files) <= self.__max_files__:
+            return
+
+        files.sort(key=lambda f: os.path.getmtime(f) if os.path.exists(f) else 0)
+        for path in files[:len(files) - self.__max_files__]:
+            try:
+                os.remove(path)
+            except OSError:
+                # 其他进程可能已删除同一个文件
+                pass
+
+    def load_bars(self, code: str, period: str, start_date: str, end_date: str, count: int = 1000) -> Optional[pd.DataFrame]:
+        """
+        加载K线数据，优先读取本地缓存，缓存未命中时从富途API拉取并写入缓存
+
+        Args:
+            code: 股票代码，如 HK.00700
+            period: 周期
+            start_date: 开始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'
+            count: 最大条数
+
+        Returns:
+            K线数据DataFrame
+        """
+        if not self._cacheable(end_date):
+            return super().load_bars(code, period, start_date, end_date, count)
+
+        path = self._cache_path(code, period, start_date, end_date, count)
+        if os.path.exists(path):
+            try:
+                df = pq.read_table(path, memory_map=True).to_pandas()
+                # 更新修改时间，淘汰时按最后使用时间排序
+                os.utime(path)
+                self.__logger__.info(f"命中K线缓存: {path}, 条数: {len(df)}")
+                return df
+            except Exception as e:
+                self.__logger__.warning(f"读取K线缓存失败，重新拉取: {path}, {e}")
+
+        df = super().load_bars(code, period, start_date, end_date, count)
+        if df is None or df.empty:
+            return df
+
+        try:
+            # 先写临时文件再替换，避免多个进程同时写同一个缓存
+            os.makedirs(self.__cache_dir__, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+            os.replace(tmp_path, path)
+            self._evict_files()
+        except Exception as e:
+            self.__logger__.warning(f"写入K线缓存失败: {path}, {e}")
+
+        return df
+
+    def _load_wts_bars(self, code: str, period: str, start_date: str, end_date: str, count: int):
+        """
+        加载WTSBarStruct数组，经过load_bars以便使用本地缓存
+        """
+        if not self._cacheable(end_date):
+            return super()._load_wts_bars(code, period, start_date, end_date, count)
+
+        df = self.load_bars(code, period, start_date, end_date, count)
+        if df is None or df.empty:
+            return None
+        return self._convert_to_wts_bars(df)
@@ -1,11 +1,15 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
 from wtpy.ExtModuleDefs import BaseExtDataLoader
 from wtpy.WtCoreDefs import WTSBarStruct, WTSTickStruct
-from ctypes import POINTER
+from wtpy.WtDataDefs import NpTypeBar, NpTypeTick
+from ctypes import POINTER, memset, sizeof
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import MappingProxyType
 
 try:
     from futu import *
@@ -13,6 +17,185 @@ except ImportError:
     print("请安装富途OpenAPI: pip install futu-api")
     raise
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# 富途K线的time_key和逐笔的time字段格式，如 '2023-01-03 09:31:00'
+FUTU_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# wtpy周期 -> 富途K线类型
+_PERIOD_MAP = MappingProxyType({
+    'm1': KLType.K_1M,
+    'm5': KLType.K_5M,
+    'm15': KLType.K_15M,
+    'm30': KLType.K_30M,
+    'h1': KLType.K_60M,
+    'd1': KLType.K_DAY,
+    'w1': KLType.K_WEEK,
+    'M1': KLType.K_MON,
+    # 兼容其他格式
+    '1m': KLType.K_1M,
+    '5m': KLType.K_5M,
+    '15m': KLType.K_15M,
+    '30m': KLType.K_30M,
+    '1h': KLType.K_60M,
+    '1d': KLType.K_DAY,
+    '1w': KLType.K_WEEK,
+    '1M': KLType.K_MON
+})
+
+# 内存中最多缓存的K线请求数
+BARS_CACHE_SIZE = 256
+
+def _parse_time(values: pd.Series) -> np.ndarray:
+    """
+    解析富途返回的时间字符串
+    安装了pyarrow时用pyarrow.compute.strptime整列解析，不经过Python的datetime对象；
+    否则安装了ciso8601时逐个解析ISO-8601字符串，比pandas的通用解析器快；
+    都没有时按FUTU_TIME_FORMAT解析，格式不符时才使用pandas的通用解析器
+    
+    Args:
+        values: 时间字符串序列，如 '2023-01-03 09:31:00'
+        
+    Returns:
+        datetime64[s]数组
+    """
+    if pc is not None:
+        try:
+            ts = pc.strptime(pa.array(values, type=pa.string()), format=FUTU_TIME_FORMAT, unit='s')
+            return ts.to_numpy(zero_copy_only=False).astype('datetime64[s]', copy=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    if ciso8601 is not None:
+        parse = ciso8601.parse_datetime_as_naive
+        return np.array([parse(s) for s in values.tolist()], dtype='datetime64[s]')
+    try:
+        time_dt = pd.to_datetime(values, format=FUTU_TIME_FORMAT, cache=True)
+    except ValueError:
+        time_dt = pd.to_datetime(values, cache=True)
+    return time_dt.to_numpy('datetime64[s]')
+
+def _pack_datetime_np(ts: np.ndarray):
+    """
+    把时间转换为YYYYMMDDHHMMSS和YYYYMMDD格式的整数
+    直接在datetime64上做整数运算，避免strftime逐个格式化再解析
+    
+    Args:
+        ts: datetime64[s]数组
+        
+    Returns:
+        (int64的YYYYMMDDHHMMSS数组, int32的YYYYMMDD数组)
+    """
+    days = ts.astype('datetime64[D]')
+    months = ts.astype('datetime64[M]')
+    
+    year = ts.astype('datetime64[Y]').astype('int64') + 1970
+    month = months.astype('int64') % 12 + 1
+    day = (days - months).astype('int64') + 1
+    secs = (ts - days).astype('int64')
+    
+    date = year * 10000 + month * 100 + day
+    hms = (secs // 3600) * 10000 + (secs % 3600 // 60) * 100 + secs % 60
+    return date * 1000000 + hms, date.astype('int32')
+
+if njit is not None:
+    # 不指定签名，首次调用时才编译，import时不产生编译开销；
+    # 不使用parallel，share_bars等在fork工作进程前调用时不会启动numba的线程池
+    @njit(cache=True)
+    def pack_ymdhms(secs, out_time, out_date):
+        """
+        把秒级时间戳打包为YYYYMMDDHHMMSS和YYYYMMDD，一次遍历写入预先分配的输出数组
+        年月日使用Howard Hinnant的civil_from_days算法，不生成中间的年月日数组
+        
+        Args:
+            secs: 1970-01-01起的秒数
+            out_time: 输出YYYYMMDDHHMMSS
+            out_date: 输出YYYYMMDD
+        """
+        for i in range(secs.shape[0]):
+            days = secs[i] // 86400
+            sod = secs[i] - days * 86400
+            
+            z = days + 719468
+            era = (z if z >= 0 else z - 146096) // 146097
+            doe = z - era * 146097
+            yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+            doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+            mp = (5 * doy + 2) // 153
+            d = doy - (153 * mp + 2) // 5 + 1
+            m = mp + 3 if mp < 10 else mp - 9
+            y = yoe + era * 400 + (1 if m <= 2 else 0)
+            
+            date = y * 10000 + m * 100 + d
+            out_date[i] = date
+            out_time[i] = date * 1000000 + (sod // 3600) * 10000 + (sod % 3600 // 60) * 100 + sod % 60
+else:
+    pack_ymdhms = None
+
+def _pack_datetime(ts: np.ndarray):
+    """
+    把时间转换为YYYYMMDDHHMMSS和YYYYMMDD格式的整数
+    安装了numba时使用编译的pack_ymdhms，否则使用datetime64整数运算
+    
+    Args:
+        ts: datetime64[s]数组
+        
+    Returns:
+        (int64的YYYYMMDDHHMMSS数组, int32的YYYYMMDD数组)
+    """
+    if pack_ymdhms is None:
+        return _pack_datetime_np(ts)
+        
+    secs = np.ascontiguousarray(ts, dtype='datetime64[s]').view('int64')
+    out_time = np.empty(len(secs), dtype=np.int64)
+    out_date = np.empty(len(secs), dtype=np.int32)
+    pack_ymdhms(secs, out_time, out_date)
+    return out_time, out_date
+
+def _as_array(col: pd.Series, dtype) -> np.ndarray:
+    """
+    取出列的numpy数组，类型已经一致时直接返回视图，不一致时才转换
+    
+    Args:
+        col: DataFrame的列
+        dtype: 目标类型
+        
+    Returns:
+        numpy数组
+    """
+    return col.to_numpy(dtype=dtype, copy=False)
+
+def _sort_by_time(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    按time列升序排列，富途返回的数据通常已经有序，有序时直接返回原表
+    
+    Args:
+        df: 包含time列的DataFrame
+        
+    Returns:
+        按time升序排列的DataFrame
+    """
+    t = df['time'].to_numpy()
+    if t.size < 2 or (np.diff(t) >= 0).all():
+        return df
+        
+    order = np.argsort(t, kind='stable')
+    return pd.DataFrame({col: df[col].to_numpy()[order] for col in df.columns})
+
 class FutuDataLoader(BaseExtDataLoader):
     """
     富途OpenAPI历史数据加载器
@@ -33,6 +216,13 @@ class FutuDataLoader(BaseExtDataLoader):
         self.__quote_ctx__ = None
         self.__logger__ = logging.getLogger("FutuDataLoader")
         
+        # (代码, 周期, 开始日期, 结束日期, 条数) -> (列名, 只读列数组)，按最近使用顺序淘汰
+        self.__bars_cache__ = OrderedDict()
+        
+        # 转换K线时复用的WTSBarStruct缓冲区，容量不足时按两倍扩容
+        self.__bar_buf__ = None
+        self.__bar_buf_cap__ = 0
+        
     def init(self):
         """
         初始化数据加载器
@@ -42,7 +232,6 @@ class FutuDataLoader(BaseExtDataLoader):
             
             # 简单测试连接是否成功建立
             self.__logger__.info(f"富途数据加载器连接成功: {self.__host__}:{self.__port__}")
-            print(f"富途数据加载器连接成功: {self.__host__}:{self.__port__}")
             return True
                 
         except Exception as e:
@@ -61,55 +250,174 @@ class FutuDataLoader(BaseExtDataLoader):
             count: 最大条数
             
         Returns:
-            K线数据DataFrame
+            K线数据DataFrame，每次返回独立的可写副本
         """
         if not self.__quote_ctx__:
             self.__logger__.error("数据加载器未初始化")
             return None
             
+        # 相同的请求直接由缓存的列数组构造DataFrame，不再访问富途API
+        key = (code, period, start_date, end_date, count)
+        df = self._get_cached_bars(key)
+        if df is not None:
+            return df
+            
         try:
             # 转换周期格式
-            ktype = self._convert_period(period)
+            ktype = _PERIOD_MAP.get(period)
             if not ktype:
                 self.__logger__.error(f"不支持的周期格式: {period}")
                 return None
                 
             # 加载历史K线
-            print(f"正在从富途API获取K线数据: {code}, 周期: {period}, 时间范围: {start_date} 至 {end_date}")
-            self.__logger__.info(f"请求K线数据: {code}, 周期: {period}, 时间范围: {start_date} 至 {end_date}")
-            
-            ret, data, page_req_key = self.__quote_ctx__.request_history_kline(
-                code=code,
-                start=start_date,
-                end=end_date,
-                ktype=ktype,
-                autype=AuType.QFQ,  # 前复权
-                max_count=count
-            )
-            
-            if ret != RET_OK:
-                error_msg = f"加载K线数据失败: {code}, 错误: {data}"
-                self.__logger__.error(error_msg)
-                print(error_msg)
-                return None
-                
-            if data.empty:
-                warning_msg = f"没有K线数据: {code}"
-                self.__logger__.warning(warning_msg)
-                print(warning_msg)
+            data = self._request_history_kline(code, period, ktype, start_date, end_date, count)
+            if data is None:
                 return None
                 
             # 转换为wtpy格式
             df = self._convert_to_wtpy_format(data)
-            success_msg = f"成功加载K线数据: {code}, 周期: {period}, 条数: {len(df)}"
-            self.__logger__.info(success_msg)
-            print(success_msg)
+            self._cache_bars(key, df)
+            self.__logger__.info(f"成功加载K线数据: {code}, 周期: {period}, 条数: {len(df)}")
             return df
             
         except Exception as e:
             self.__logger__.error(f"加载K线数据时发生错误: {e}")
             return None
             
+    def load_many(self, codes: List[str], period: str, start_date: str, end_date: str, count: int = 1000,
+                  max_workers: int = 4) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+        """
+        并发加载多个代码的K线数据
+        富途API的请求在线程池中并发发出，等待网络时释放GIL，
+        先返回的结果在调用线程上转换，转换与其余请求的网络等待重叠
+        
+        Args:
+            codes: 股票代码列表
+            period: 周期
+            start_date: 开始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'
+            count: 每个代码的最大条数
+            max_workers: 同时在途的请求数，受富途API频率限制，不宜过大
+            
+        Returns:
+            按完成顺序产生(代码, K线数据DataFrame)，加载失败的代码对应None
+        """
+        if not self.__quote_ctx__:
+            self.__logger__.error("数据加载器未初始化")
+            return
+            
+        ktype = _PERIOD_MAP.get(period)
+        if not ktype:
+            self.__logger__.error(f"不支持的周期格式: {period}")
+            return
+            
+        # 已缓存的代码直接返回，其余的提交到线程池
+        pending = []
+        for code in codes:
+            df = self._get_cached_bars((code, period, start_date, end_date, count))
+            if df is not None:
+                yield code, df
+            else:
+                pending.append(code)
+        if not pending:
+            return
+            
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            futures = {
+                executor.submit(self._request_history_kline, code, period, ktype, start_date, end_date, count): code
+                for code in pending
+            }
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    data = future.result()
+                    if data is None:
+                        yield code, None
+                        continue
+                        
+                    df = self._convert_to_wtpy_format(data)
+                    self._cache_bars((code, period, start_date, end_date, count), df)
+                    self.__logger__.info(f"成功加载K线数据: {code}, 周期: {period}, 条数: {len(df)}")
+                except Exception as e:
+                    self.__logger__.error(f"加载K线数据时发生错误: {code}, {e}")
+                    df = None
+                yield code, df
+                
+    def _request_history_kline(self, code: str, period: str, ktype, start_date: str, end_date: str, count: int) -> Optional[pd.DataFrame]:
+        """
+        向富途API请求历史K线
+        
+        Args:
+            code: 股票代码
+            period: wtpy周期，仅用于日志
+            ktype: 富途K线类型
+            start_date: 开始日期
+            end_date: 结束日期
+            count: 最大条数
+            
+        Returns:
+            富途原始K线数据，失败或没有数据时返回None
+        """
+        self.__logger__.info(f"请求K线数据: {code}, 周期: {period}, 时间范围: {start_date} 至 {end_date}")
+        
+        ret, data, page_req_key = self.__quote_ctx__.request_history_kline(
+            code=code,
+            start=start_date,
+            end=end_date,
+            ktype=ktype,
+            autype=AuType.QFQ,  # 前复权
+            max_count=count
+        )
+        
+        if ret != RET_OK:
+            self.__logger__.error(f"加载K线数据失败: {code}, 错误: {data}")
+            return None
+            
+        if data.empty:
+            self.__logger__.warning(f"没有K线数据: {code}")
+            return None
+            
+        return data
+        
+    def _get_cached_bars(self, key: tuple) -> Optional[pd.DataFrame]:
+        """
+        从缓存的列数组复制出DataFrame，未命中时返回None
+        返回的DataFrame与首次加载时一样可写，修改不会影响缓存
+        
+        Args:
+            key: 请求参数
+        """
+        cached = self.__bars_cache__.get(key)
+        if cached is None:
+            return None
+            
+        self.__bars_cache__.move_to_end(key)
+        columns, arrays = cached
+        return pd.DataFrame(dict(zip(columns, arrays)), copy=True)
+        
+    def _cache_bars(self, key: tuple, df: pd.DataFrame):
+        """
+        把转换好的K线以只读列数组的形式放入缓存，超出容量时淘汰最久未使用的请求
+        未指定结束日期（截止到当前）或结束日期为今天及之后的请求包含未收盘的K线，不放入缓存
+        
+        Args:
+            key: 请求参数(代码, 周期, 开始日期, 结束日期, 条数)
+            df: wtpy格式的K线数据
+        """
+        end_date = key[3]
+        if df.empty or not end_date or end_date >= datetime.now().strftime('%Y-%m-%d'):
+            return
+            
+        arrays = []
+        for col in df.columns:
+            arr = df[col].to_numpy().copy()
+            arr.flags.writeable = False
+            arrays.append(arr)
+            
+        self.__bars_cache__[key] = (tuple(df.columns), tuple(arrays))
+        if len(self.__bars_cache__) > BARS_CACHE_SIZE:
+            self.__bars_cache__.popitem(last=False)
+            
     def load_ticks(self, code: str, date: str, count: int = 1000) -> Optional[pd.DataFrame]:
         """
         加载Tick数据
@@ -186,26 +494,7 @@ class FutuDataLoader(BaseExtDataLoader):
         Returns:
             富途周期格式
         """
-        period_mapping = {
-            'm1': KLType.K_1M,
-            'm5': KLType.K_5M,
-            'm15': KLType.K_15M,
-            'm30': KLType.K_30M,
-            'h1': KLType.K_60M,
-            'd1': KLType.K_DAY,
-            'w1': KLType.K_WEEK,
-            'M1': KLType.K_MON,
-            # 兼容其他格式
-            '1m': KLType.K_1M,
-            '5m': KLType.K_5M,
-            '15m': KLType.K_15M,
-            '30m': KLType.K_30M,
-            '1h': KLType.K_60M,
-            '1d': KLType.K_DAY,
-            '1w': KLType.K_WEEK,
-            '1M': KLType.K_MON
-        }
-        return period_mapping.get(period)
+        return _PERIOD_MAP.get(period)
         
     def _convert_to_wtpy_format(self, futu_data: pd.DataFrame) -> pd.DataFrame:
         """
@@ -217,31 +506,34 @@ class FutuDataLoader(BaseExtDataLoader):
         Returns:
             wtpy格式的K线数据
         """
+        if futu_data is None or len(futu_data) == 0:
+            return pd.DataFrame(columns=['time', 'date', 'open', 'high', 'low', 'close', 'vol', 'turnover', 'interest'])
+            
         try:
-            df = pd.DataFrame()
+            n = len(futu_data)
             
             # 时间转换
-            time_dt = pd.to_datetime(futu_data['time_key'])
-            df['time'] = time_dt.dt.strftime('%Y%m%d%H%M%S').astype('int64')
-            df['date'] = time_dt.dt.strftime('%Y%m%d').astype('int32')
-            
-            # OHLCV数据
-            df['open'] = futu_data['open'].astype(float)
-            df['high'] = futu_data['high'].astype(float)
-            df['low'] = futu_data['low'].astype(float)
-            df['close'] = futu_data['close'].astype(float)
-            df['vol'] = futu_data['volume'].astype(int)
-            
-            # 成交额
-            if 'turnover' in futu_data.columns:
-                df['turnover'] = futu_data['turnover'].astype(float)
-            else:
-                df['turnover'] = 0.0
-                
-            # 持仓量（股票没有，设为0）
-            df['interest'] = 0
-            
-            return df.sort_values('time').reset_index(drop=True)
+            time_dt = _parse_time(futu_data['time_key'])
+            time_int, date_int = _pack_datetime(time_dt)
+            
+            # 先准备好全部列，再一次性构造DataFrame
+            cols = {
+                'time': time_int,
+                'date': date_int,
+                # OHLCV数据
+                'open': _as_array(futu_data['open'], np.float64),
+                'high': _as_array(futu_data['high'], np.float64),
+                'low': _as_array(futu_data['low'], np.float64),
+                'close': _as_array(futu_data['close'], np.float64),
+                'vol': _as_array(futu_data['volume'], np.int64),
+                # 成交额
+                'turnover': _as_array(futu_data['turnover'], np.float64) if 'turnover' in futu_data.columns else np.zeros(n),
+                # 持仓量（股票没有，设为0）
+                'interest': np.zeros(n, dtype=np.int64)
+            }
+            df = pd.DataFrame(cols, copy=False)
+            
+            return _sort_by_time(df)
             
         except Exception as e:
             self.__logger__.error(f"转换K线数据格式时发生错误: {e}")
@@ -257,28 +549,45 @@ class FutuDataLoader(BaseExtDataLoader):
         Returns:
             wtpy格式的Tick数据
         """
+        if futu_data is None or len(futu_data) == 0:
+            return pd.DataFrame(columns=['time', 'date', 'price', 'volume', 'turnover', 'direction'])
+            
         try:
-            df = pd.DataFrame()
+            n = len(futu_data)
             
             # 时间转换
-            time_dt = pd.to_datetime(futu_data['time'])
-            df['time'] = time_dt.dt.strftime('%Y%m%d%H%M%S').astype('int64')
-            df['date'] = time_dt.dt.strftime('%Y%m%d').astype('int32')
-            
-            # 价格数据
-            df['price'] = futu_data['price'].astype(float)
-            df['volume'] = futu_data['volume'].astype(int)
-            df['turnover'] = futu_data['turnover'].astype(float) if 'turnover' in futu_data.columns else 0.0
-            
-            # 买卖方向
-            df['direction'] = futu_data['direction'] if 'direction' in futu_data.columns else 0
-            
-            return df.sort_values('time').reset_index(drop=True)
+            time_dt = _parse_time(futu_data['time'])
+            time_int, date_int = _pack_datetime(time_dt)
+            
+            # 先准备好全部列，再一次性构造DataFrame
+            cols = {
+                'time': time_int,
+                'date': date_int,
+                # 价格数据
+                'price': _as_array(futu_data['price'], np.float64),
+                'volume': _as_array(futu_data['volume'], np.int64),
+                'turnover': _as_array(futu_data['turnover'], np.float64) if 'turnover' in futu_data.columns else np.zeros(n),
+                # 买卖方向
+                'direction': futu_data['direction'].to_numpy() if 'direction' in futu_data.columns else np.zeros(n, dtype=np.int64)
+            }
+            df = pd.DataFrame(cols, copy=False)
+            
+            return _sort_by_time(df)
             
         except Exception as e:
             self.__logger__.error(f"转换Tick数据格式时发生错误: {e}")
             return pd.DataFrame()
             
+    def _final_bars_range(self) -> Tuple[str, str]:
+        """
+        load_final_his_bars请求的时间范围，默认为最近2年
+        
+        Returns:
+            (开始日期, 结束日期)，格式 'YYYY-MM-DD'
+        """
+        now = datetime.now()
+        return (now - timedelta(days=730)).strftime('%Y-%m-%d'), now.strftime('%Y-%m-%d')
+        
     def load_final_his_bars(self, stdCode: str, period: str, feeder) -> bool:
         """
         加载最终历史K线（回测、实盘）
@@ -295,31 +604,53 @@ class FutuDataLoader(BaseExtDataLoader):
         try:
             self.__logger__.info(f"开始加载最终历史K线: {stdCode}, 周期: {period}")
             
-            # 计算时间范围（默认加载最近2年数据）
-            end_date = datetime.now().strftime('%Y-%m-%d')
-            start_date = (datetime.now() - timedelta(days=730)).strftime('%Y-%m-%d')
+            start_date, end_date = self._final_bars_range()
             
-            # 加载K线数据
-            df = self.load_bars(stdCode, period, start_date, end_date, count=10000)
-            if df is None or df.empty:
-                self.__logger__.warning(f"未获取到K线数据: {stdCode}")
-                return False
-                
-            # 转换为WTSBarStruct格式并调用feeder
-            bars_data = self._convert_to_wts_bars(df)
+            # 加载K线并转换为WTSBarStruct格式，再调用feeder
+            bars_data = self._load_wts_bars(stdCode, period, start_date, end_date, count=10000)
             if bars_data is not None:
-                count = len(df)
+                count = len(bars_data)
                 feeder(bars_data, count)
                 self.__logger__.info(f"成功加载最终历史K线: {stdCode}, 条数: {count}")
                 return True
             else:
-                self.__logger__.warning(f"转换K线数据失败: {stdCode}")
+                self.__logger__.warning(f"未获取到K线数据: {stdCode}")
                 return False
                 
         except Exception as e:
             self.__logger__.error(f"加载最终历史K线时发生错误: {e}")
             return False
             
+    def _load_wts_bars(self, code: str, period: str, start_date: str, end_date: str, count: int):
+        """
+        加载K线并直接转换为WTSBarStruct数组
+        富途数据的列直接写入ctypes缓冲区，不经过中间的wtpy格式DataFrame
+        
+        Args:
+            code: 股票代码
+            period: 周期
+            start_date: 开始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'
+            count: 最大条数
+            
+        Returns:
+            WTSBarStruct数组，失败时返回None
+        """
+        if not self.__quote_ctx__:
+            self.__logger__.error("数据加载器未初始化")
+            return None
+            
+        ktype = _PERIOD_MAP.get(period)
+        if not ktype:
+            self.__logger__.error(f"不支持的周期格式: {period}")
+            return None
+            
+        data = self._request_history_kline(code, period, ktype, start_date, end_date, count)
+        if data is None:
+            return None
+            
+        return self._convert_futu_to_wts_bars_direct(data)
+            
     def load_raw_his_bars(self, stdCode: str, period: str, feeder) -> bool:
         """
         加载未加工的历史K线（回测、实盘）
@@ -412,27 +743,84 @@ class FutuDataLoader(BaseExtDataLoader):
             df: K线数据DataFrame
             
         Returns:
-            WTSBarStruct数组
+            WTSBarStruct数组，使用复用的缓冲区，下一次转换时会被覆盖
         """
         try:
             
             if df.empty:
                 return None
                 
-            # 创建WTSBarStruct数组
-            BUFFER = WTSBarStruct * len(df)
-            buffer = BUFFER()
+            # 从复用的缓冲区取出WTSBarStruct数组，已清零，未赋值的字段保持为0
+            buffer = self._alloc_wts_bars(len(df))
+            
+            # 用与WTSBarStruct内存布局一致的numpy视图按列整体赋值，不再逐行设置
+            bars = np.frombuffer(buffer, dtype=NpTypeBar)
+            bars['date'] = df['date'].to_numpy()
+            bars['time'] = df['time'].to_numpy()
+            bars['open'] = df['open'].to_numpy()
+            bars['high'] = df['high'].to_numpy()
+            bars['low'] = df['low'].to_numpy()
+            bars['close'] = df['close'].to_numpy()
+            bars['volume'] = df['vol'].to_numpy()
+            return buffer
+            
+        except Exception as e:
+            self.__logger__.error(f"转换WTSBarStruct时发生错误: {e}")
+            return None
+        
+    def _alloc_wts_bars(self, n: int):
+        """
+        从复用的缓冲区中取出n条清零的WTSBarStruct
+        feeder会把K线复制到引擎内部，缓冲区只需要在一次feeder调用内有效，
+        返回的数组在下一次转换K线时会被覆盖，需要保留时应自行复制
+        
+        Args:
+            n: K线条数
+            
+        Returns:
+            长度为n的WTSBarStruct数组，与缓冲区共享内存
+        """
+        if self.__bar_buf_cap__ < n:
+            self.__bar_buf_cap__ = n * 2
+            self.__bar_buf__ = (WTSBarStruct * self.__bar_buf_cap__)()
+        else:
+            memset(self.__bar_buf__, 0, n * sizeof(WTSBarStruct))
+        return (WTSBarStruct * n).from_buffer(self.__bar_buf__)
+        
+    def _convert_futu_to_wts_bars_direct(self, futu_data: pd.DataFrame):
+        """
+        将富途K线数据直接转换为WTSBarStruct格式
+        与_convert_to_wtpy_format加_convert_to_wts_bars的结果一致，但省去中间的DataFrame
+        
+        Args:
+            futu_data: 富途K线数据
+            
+        Returns:
+            WTSBarStruct数组，使用复用的缓冲区，下一次转换时会被覆盖
+        """
+        if futu_data is None or len(futu_data) == 0:
+            return None
+            
+        try:
+            time_int, date_int = _pack_datetime(_parse_time(futu_data['time_key']))
             
-            # 填充数据
-            for i, row in df.iterrows():
-                bar = buffer[i]
-                bar.date = int(row['date'])
-                bar.time = int(row['time'])
-                bar.open = float(row['open'])
-                bar.high = float(row['high'])
-                bar.low = float(row['low'])
-                bar.close = float(row['close'])
-                bar.vol = float(row['vol'])     
+            # 富途返回的数据通常已经有序，乱序时才按时间重排
+            order = None
+            if len(time_int) > 1 and not (np.diff(time_int) >= 0).all():
+                order = np.argsort(time_int, kind='stable')
+                
+            def column(values):
+                return values if order is None else values[order]
+                
+            buffer = self._alloc_wts_bars(len(futu_data))
+            bars = np.frombuffer(buffer, dtype=NpTypeBar)
+            bars['date'] = column(date_int)
+            bars['time'] = column(time_int)
+            bars['open'] = column(futu_data['open'].to_numpy())
+            bars['high'] = column(futu_data['high'].to_numpy())
+            bars['low'] = column(futu_data['low'].to_numpy())
+            bars['close'] = column(futu_data['close'].to_numpy())
+            bars['volume'] = column(futu_data['volume'].to_numpy())
             return buffer
             
         except Exception as e:
@@ -453,39 +841,20 @@ class FutuDataLoader(BaseExtDataLoader):
             if df.empty:
                 return None
                 
-            # 创建WTSTickStruct数组
+            # 创建WTSTickStruct数组，ctypes数组已清零，开高低、昨收和买卖盘等未提供的字段保持为0
             BUFFER = WTSTickStruct * len(df)
             buffer = BUFFER()
             
-            # 填充数据
-            for i, row in df.iterrows():
-                tick = buffer[i]
-                
-                # 基本信息
-                tick.action_date = int(row['date'])
-                tick.action_time = int(row['time'])
-                tick.price = float(row['price'])
-                tick.total_volume = float(row['volume'])
-                
-                # 其他字段设置默认值
-                tick.open = 0.0
-                tick.high = 0.0
-                tick.low = 0.0
-                tick.settle = 0.0
-                tick.total_turnover = float(row.get('turnover', 0.0))
-                tick.open_interest = 0.0
-                tick.trading_date = int(row['date'])
-                tick.pre_close = 0.0
-                tick.pre_settle = 0.0
-                tick.pre_interest = 0.0
-                
-                # 买卖盘数据（富途实时数据可能没有完整的五档数据）
-                for x in range(5):
-                    tick.bid_prices[x] = 0.0
-                    tick.bid_qty[x] = 0.0
-                    tick.ask_prices[x] = 0.0
-                    tick.ask_qty[x] = 0.0
-                    
+            # 用与WTSTickStruct内存布局一致的numpy视图按列整体赋值
+            ticks = np.frombuffer(buffer, dtype=NpTypeTick)
+            date = df['date'].to_numpy()
+            ticks['action_date'] = date
+            ticks['trading_date'] = date
+            # action_time为HHMMSSmmm格式
+            ticks['action_time'] = df['time'].to_numpy() % 1000000 * 1000
+            ticks['price'] = df['price'].to_numpy()
+            ticks['total_volume'] = df['volume'].to_numpy()
+            ticks['total_turnover'] = df['turnover'].to_numpy()
             return buffer
             
         except Exception as e:
@@ -494,8 +863,11 @@ class FutuDataLoader(BaseExtDataLoader):
         
     def close(self):
         """
-        关闭连接
+        关闭连接，同时清空K线缓存
         """
+        self.__bars_cache__.clear()
+        self.__bar_buf__ = None
+        self.__bar_buf_cap__ = 0
         if self.__quote_ctx__:
             try:
                 self.__quote_ctx__.close()
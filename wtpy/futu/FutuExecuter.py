@@ -1,6 +1,5 @@
-import threading
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from wtpy import BaseExtExecuter
 import logging
 
@@ -10,6 +9,40 @@ except ImportError:
     print("请安装富途OpenAPI: pip install futu-api")
     raise
 
+# 有代码下单后，距离上次同步持仓超过该秒数时，下一次设置仓位前重新同步全部持仓
+RECONCILE_INTERVAL = 5.0
+
+# 行情快照取不到每手股数时使用的默认值（港股常见的每手股数）
+DEFAULT_LOT_SIZE = 100
+
+# 仍可能成交的订单状态，这些订单的未成交数量要计入当前仓位
+OPEN_ORDER_STATUS = [OrderStatus.WAITING_SUBMIT, OrderStatus.SUBMITTING,
+                     OrderStatus.SUBMITTED, OrderStatus.FILLED_PART]
+
+class LastPriceHandler(StockQuoteHandlerBase):
+    """
+    报价推送处理器，把各代码的最新价写入缓存字典
+    """
+    
+    def __init__(self, last_prices: Dict[str, float]):
+        """
+        Args:
+            last_prices: 代码 -> 最新价的缓存字典
+        """
+        super().__init__()
+        self.__last_prices__ = last_prices
+        
+    def on_recv_rsp(self, rsp_pb):
+        """
+        接收报价推送
+        """
+        ret, data = super().on_recv_rsp(rsp_pb)
+        if ret != RET_OK:
+            return RET_ERROR, data
+            
+        self.__last_prices__.update(zip(data['code'], data['last_price']))
+        return RET_OK, data
+
 class FutuExecuter(BaseExtExecuter):
     """
     富途OpenAPI交易执行器
@@ -35,8 +68,19 @@ class FutuExecuter(BaseExtExecuter):
         self.__unlock_pwd__ = unlock_pwd
         self.__is_simulate__ = is_simulate
         self.__trade_ctx__ = None
+        self.__quote_ctx__ = None
         self.__is_connected__ = False
         self.__current_positions__: Dict[str, float] = {}
+        # 上次同步持仓后下过单的代码，这些代码的本地持仓可能已经过期
+        self.__dirty_positions__ = set()
+        self.__last_sync__ = 0.0
+        # 代码 -> 已下单但未成交的数量（买为正、卖为负），成交、撤单或拒单后由同步订单列表移除
+        self.__open_qty__: Dict[str, float] = {}
+        self.__pending_orders__: List[Tuple[str, float, TrdSide]] = []
+        self.__last_prices__: Dict[str, float] = {}
+        # 代码 -> 每手股数，由行情快照按需填充
+        self.__lot_sizes__: Dict[str, int] = {}
+        self.__quote_subs__ = set()
         self.__logger__ = logging.getLogger(f"FutuExecuter_{id}")
         
     def init(self):
@@ -67,6 +111,10 @@ class FutuExecuter(BaseExtExecuter):
                     self.__logger__.error(f"解锁交易失败: {data}")
                     return
                     
+            # 行情上下文在执行器生命周期内复用，下单取价时不再每次重新建立连接
+            self.__quote_ctx__ = OpenQuoteContext(host=self.__host__, port=self.__port__)
+            self.__quote_ctx__.set_handler(LastPriceHandler(self.__last_prices__))
+                    
             # 获取账户信息
             ret, data = self.__trade_ctx__.get_acc_list()
             if ret == RET_OK:
@@ -90,37 +138,127 @@ class FutuExecuter(BaseExtExecuter):
             stdCode: 标准代码，如 HK.00700
             targetPos: 目标仓位
         """
+        self.set_positions({stdCode: targetPos})
+        
+    def set_positions(self, targets: Dict[str, float]):
+        """
+        批量设置目标仓位，所有订单共用一次行情快照请求
+        引擎通过set_position逐个代码调用，每次只有一个代码；需要合并请求时由调用方直接调用本方法
+        
+        Args:
+            targets: 标准代码 -> 目标仓位
+        """
         if not self.__is_connected__:
             self.__logger__.warning("未连接到富途交易服务，无法执行交易")
             return
             
         try:
-            # 调用父类方法更新目标仓位
-            super().set_position(stdCode, targetPos)
+            self._maybe_reconcile(targets)
+            for stdCode, targetPos in targets.items():
+                self._queue_order(stdCode, targetPos)
+            self._flush_orders()
             
-            # 获取当前仓位
-            current_pos = self.__current_positions__.get(stdCode, 0.0)
+        except Exception as e:
+            self.__logger__.error(f"设置仓位时发生错误: {e}")
+            
+    def _maybe_reconcile(self, codes):
+        """
+        需要时用一次get_position_list和get_order_list同步持仓和未成交数量
+        本次要调整的代码在上次同步后下过单或仍有未成交订单，或者距离上次同步已超过RECONCILE_INTERVAL时才同步，
+        连续调整不同代码的仓位时不会每次都请求一次持仓
+        
+        Args:
+            codes: 本次要调整仓位的代码
+        """
+        # 还有未成交订单的代码也要同步，订单成交、撤单或拒单后才能从未成交数量中移除
+        dirty = self.__dirty_positions__.union(self.__open_qty__)
+        if not dirty:
+            return
             
-            # 计算需要交易的数量
-            diff = targetPos - current_pos
+        if dirty.isdisjoint(codes) and time.monotonic() - self.__last_sync__ < RECONCILE_INTERVAL:
+            return
             
-            if abs(diff) < 0.01:  # 忽略微小差异
-                return
-                
-            # 执行交易
-            if diff > 0:
-                # 买入
-                self._place_order(stdCode, abs(diff), TrdSide.BUY)
+        self._update_positions()
+        
+    def _queue_order(self, stdCode: str, targetPos: float):
+        """
+        计算目标仓位与当前仓位的差异，生成待下单的订单
+        
+        Args:
+            stdCode: 标准代码
+            targetPos: 目标仓位
+        """
+        # 调用父类方法更新目标仓位
+        super().set_position(stdCode, targetPos)
+        
+        # 获取当前仓位，已下单未成交的数量也计入，避免重复下单
+        current_pos = self.__current_positions__.get(stdCode, 0.0) + self.__open_qty__.get(stdCode, 0.0)
+        
+        # 计算需要交易的数量
+        diff = targetPos - current_pos
+        
+        if abs(diff) < 0.01:  # 忽略微小差异
+            return
+            
+        trd_side = TrdSide.BUY if diff > 0 else TrdSide.SELL
+        self.__pending_orders__.append((stdCode, abs(diff), trd_side))
+        self.__logger__.info(f"仓位调整: {stdCode}, 当前: {current_pos}, 目标: {targetPos}, 差异: {diff}")
+        
+    def _flush_orders(self):
+        """
+        发出所有待下单的订单
+        已订阅报价的代码优先使用推送的最新价，未订阅成功的代码收不到推送，缓存的价格会过期，每次都重新取快照；
+        需要快照的代码合并为一次请求
+        """
+        orders = self.__pending_orders__
+        self.__pending_orders__ = []
+        if not orders:
+            return
+            
+        codes = list(dict.fromkeys(code for code, _, _ in orders))
+        self._subscribe_quotes(codes)
+        
+        prices = self.__last_prices__
+        lot_sizes = self.__lot_sizes__
+        subs = self.__quote_subs__
+        missing = [code for code in codes if code not in subs or code not in prices or code not in lot_sizes]
+        if missing:
+            ret, data = self.__quote_ctx__.get_market_snapshot(missing)
+            if ret != RET_OK:
+                self.__logger__.error(f"获取价格失败: {missing}, {data}")
             else:
-                # 卖出
-                self._place_order(stdCode, abs(diff), TrdSide.SELL)
-                
-            self.__logger__.info(f"仓位调整: {stdCode}, 当前: {current_pos}, 目标: {targetPos}, 差异: {diff}")
+                for code, price in zip(data['code'], data['last_price']):
+                    # 已订阅的代码以推送的价格为准，未订阅的代码用快照覆盖旧价格
+                    if code in subs:
+                        prices.setdefault(code, price)
+                    else:
+                        prices[code] = price
+                lot_sizes.update((code, int(lot)) for code, lot in zip(data['code'], data['lot_size']) if lot > 0)
             
-        except Exception as e:
-            self.__logger__.error(f"设置仓位时发生错误: {e}")
+        for code, qty, trd_side in orders:
+            if code not in prices:
+                self.__logger__.error(f"没有价格数据: {code}")
+                continue
+            self._place_order(code, qty, trd_side, prices[code])
+            
+    def _subscribe_quotes(self, codes: List[str]):
+        """
+        订阅尚未订阅的代码的报价推送，之后的最新价由LastPriceHandler更新
+        
+        Args:
+            codes: 股票代码列表
+        """
+        new_codes = [code for code in codes if code not in self.__quote_subs__]
+        if not new_codes:
+            return
+            
+        ret, err_msg = self.__quote_ctx__.subscribe(new_codes, [SubType.QUOTE])
+        if ret == RET_OK:
+            self.__quote_subs__.update(new_codes)
+        else:
+            self.__logger__.warning(f"订阅报价失败，改用行情快照取价: {new_codes}, {err_msg}")
             
-    def _place_order(self, code: str, qty: float, trd_side: TrdSide):
+    def _place_order(self, code: str, qty: float, trd_side: TrdSide, current_price: float):
         """
         下单
         
@@ -128,30 +266,23 @@ class FutuExecuter(BaseExtExecuter):
             code: 股票代码
             qty: 数量
             trd_side: 交易方向
+            current_price: 当前价格
         """
         try:
-            # 获取当前价格
-            quote_ctx = OpenQuoteContext(host=self.__host__, port=self.__port__)
-            ret, data = quote_ctx.get_market_snapshot([code])
-            quote_ctx.close()
-            
-            if ret != RET_OK:
-                self.__logger__.error(f"获取价格失败: {code}, {data}")
+            # 按每手股数向下取整，不足一手的数量会被富途拒单
+            lot = self.__lot_sizes__.get(code, DEFAULT_LOT_SIZE)
+            qty = int(qty) // lot * lot
+            if qty == 0:
+                self.__logger__.warning(f"下单数量不足一手，跳过: {code}, 每手: {lot}")
                 return
                 
-            if data.empty:
-                self.__logger__.error(f"没有价格数据: {code}")
-                return
-                
-            current_price = data.iloc[0]['last_price']
-            
             # 计算下单价格（市价单使用当前价格）
             order_price = current_price
             
             # 下单
             ret, data = self.__trade_ctx__.place_order(
                 price=order_price,
-                qty=int(qty),
+                qty=qty,
                 code=code,
                 trd_side=trd_side,
                 order_type=OrderType.NORMAL,  # 普通订单
@@ -162,11 +293,10 @@ class FutuExecuter(BaseExtExecuter):
                 order_id = data['order_id'][0]
                 self.__logger__.info(f"下单成功: {code}, 方向: {trd_side}, 数量: {qty}, 价格: {order_price}, 订单ID: {order_id}")
                 
-                # 更新本地仓位记录
-                if trd_side == TrdSide.BUY:
-                    self.__current_positions__[code] = self.__current_positions__.get(code, 0) + qty
-                else:
-                    self.__current_positions__[code] = self.__current_positions__.get(code, 0) - qty
+                # 在同步到订单状态前，按未成交数量计入仓位；部分成交、拒单等情况以下次同步为准
+                signed = qty if trd_side == TrdSide.BUY else -qty
+                self.__open_qty__[code] = self.__open_qty__.get(code, 0.0) + signed
+                self.__dirty_positions__.add(code)
             else:
                 self.__logger__.error(f"下单失败: {code}, 错误: {data}")
                 
@@ -175,12 +305,16 @@ class FutuExecuter(BaseExtExecuter):
             
     def _update_positions(self):
         """
-        更新当前持仓信息
+        更新当前持仓信息，以及各代码未成交订单的数量
         """
         try:
-            ret, data = self.__trade_ctx__.get_position_list(
-                trd_env=TrdEnv.SIMULATE if self.__is_simulate__ else TrdEnv.REAL
-            )
+            trd_env = TrdEnv.SIMULATE if self.__is_simulate__ else TrdEnv.REAL
+            
+            # 先取未成交订单再取持仓：两次请求之间成交的订单会同时计入未成交数量和持仓，只会少下单；
+            # 顺序反过来时这笔成交两边都看不到，下次计算差异会重复下单
+            # 订单列表取不到时保留本地记录的未成交数量，并保持dirty以便下次重试
+            orders_ok = self._update_open_orders(trd_env)
+            ret, data = self.__trade_ctx__.get_position_list(trd_env=trd_env)
             
             if ret == RET_OK:
                 self.__current_positions__.clear()
@@ -189,6 +323,11 @@ class FutuExecuter(BaseExtExecuter):
                     qty = float(row['qty'])
                     self.__current_positions__[code] = qty
                     
+                if not orders_ok:
+                    return
+                self.__dirty_positions__.clear()
+                self.__last_sync__ = time.monotonic()
+                    
                 self.__logger__.info(f"持仓更新完成: {self.__current_positions__}")
             else:
                 self.__logger__.error(f"获取持仓失败: {data}")
@@ -196,6 +335,32 @@ class FutuExecuter(BaseExtExecuter):
         except Exception as e:
             self.__logger__.error(f"更新持仓时发生错误: {e}")
             
+    def _update_open_orders(self, trd_env) -> bool:
+        """
+        用get_order_list重建各代码未成交订单的数量
+        
+        Args:
+            trd_env: 交易环境
+            
+        Returns:
+            bool: 是否同步成功
+        """
+        ret, data = self.__trade_ctx__.get_order_list(status_filter_list=OPEN_ORDER_STATUS, trd_env=trd_env)
+        if ret != RET_OK:
+            self.__logger__.error(f"获取订单列表失败: {data}")
+            return False
+            
+        open_qty: Dict[str, float] = {}
+        for code, side, qty, dealt in zip(data['code'], data['trd_side'], data['qty'], data['dealt_qty']):
+            left = float(qty) - float(dealt)
+            if left <= 0:
+                continue
+            if side not in (TrdSide.BUY, TrdSide.BUY_BACK):
+                left = -left
+            open_qty[code] = open_qty.get(code, 0.0) + left
+        self.__open_qty__ = open_qty
+        return True
+            
     def get_position(self, code: str) -> float:
         """
         获取指定代码的当前仓位
@@ -221,6 +386,14 @@ class FutuExecuter(BaseExtExecuter):
         """
         关闭连接
         """
+        if self.__quote_ctx__:
+            try:
+                self.__quote_ctx__.close()
+                self.__quote_ctx__ = None
+                self.__quote_subs__.clear()
+            except Exception as e:
+                self.__logger__.error(f"关闭行情连接时发生错误: {e}")
+                
         if self.__trade_ctx__:
             try:
                 self.__trade_ctx__.close()
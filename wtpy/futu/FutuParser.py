@@ -1,16 +1,66 @@
 import threading
 import time
-from typing import Dict, Set
+from functools import partial
+from typing import Dict, List, Tuple, Union
 from wtpy import BaseExtParser, WTSTickStruct
-from ctypes import byref
+from wtpy.WtDataDefs import NpTypeTick
+from ctypes import byref, sizeof
 import logging
 
+import numpy as np
+import pandas as pd
+
 try:
     from futu import *
 except ImportError:
     print("请安装富途OpenAPI: pip install futu-api")
     raise
 
+_LOG = logging.getLogger("FutuParser")
+
+class _ParserLogAdapter(logging.LoggerAdapter):
+    """
+    在日志前加上解析器ID
+    """
+    
+    def process(self, msg, kwargs):
+        return f"[{self.extra['pid']}] {msg}", kwargs
+
+# 富途行情列 -> WTSTickStruct字段，WTSTickStruct的数值字段都是double
+_QUOTE_FIELDS = (
+    ('open_price', 'open'),
+    ('high_price', 'high'),
+    ('low_price', 'low'),
+    ('prev_close_price', 'pre_close'),
+    ('volume', 'total_volume'),
+    ('turnover', 'total_turnover'),
+    ('bid_price', 'bid_price_0'),
+    ('ask_price', 'ask_price_0'),
+    ('bid_vol', 'bid_qty_0'),
+    ('ask_vol', 'ask_qty_0'),
+)
+
+TICK_SIZE = sizeof(WTSTickStruct)
+
+# 富途订阅和取消订阅接口每次请求最多的代码数
+FUTU_BATCH_SIZE = 400
+
+def _column(data, name: str, dtype) -> np.ndarray:
+    """
+    取出行情数据的一列，缺少该列时返回全0数组
+    
+    Args:
+        data: 富途行情数据
+        name: 列名
+        dtype: 数组类型
+        
+    Returns:
+        numpy数组
+    """
+    if name in data.columns:
+        return data[name].to_numpy(dtype=dtype)
+    return np.zeros(len(data), dtype=dtype)
+
 class FutuParser(BaseExtParser):
     """
     富途OpenAPI数据解析器
@@ -30,10 +80,29 @@ class FutuParser(BaseExtParser):
         self.__host__ = host
         self.__port__ = port
         self.__quote_ctx__ = None
-        self.__subscribed_codes__: Set[str] = set()
-        self.__code_mapping__: Dict[str, str] = {}  # wtpy代码 -> 富途代码映射
+        # wtpy代码 -> 富途代码映射，dict保持订阅顺序，取消订阅时按此顺序分批
+        self.__code_mapping__: Dict[str, str] = {}
+        self.__code_bytes__: Dict[str, Tuple[bytes, bytes]] = {}  # 富途代码 -> 编码好的(交易所, 代码)
+        # 由__code_bytes__生成的查找表，行情回调中整列查找代码并批量复制交易所和代码
+        self.__code_index__ = pd.Index([], dtype=object)
+        self.__exchg_table__ = np.empty(0, dtype=NpTypeTick['exchg'])
+        self.__code_table__ = np.empty(0, dtype=NpTypeTick['code'])
         self.__is_connected__ = False
-        self.__logger__ = logging.getLogger(f"FutuParser_{id}")
+        self._log = _ParserLogAdapter(_LOG, {"pid": id})
+        
+        # 向引擎推送tick的函数，在init中绑定
+        self.__push_quote__ = None
+        
+        # 推送用的WTSTickStruct数组，引擎在推送时复制数据，各次回调复用，容量不足时按两倍扩容
+        self.__tick_buf__ = None
+        self.__tick_buf_cap__ = 0
+        
+        # 行情列名 -> (已有列对应的字段, 缺失列对应的字段)，富途按市场返回的列不同，每种列组合只分析一次
+        self.__schema_plans__: Dict[tuple, Tuple[tuple, tuple]] = {}
+        
+        # 最近一次计算的本地时间戳，同一秒内的回调直接复用
+        self.__stamp_sec__ = -1
+        self.__stamp__ = (0, 0)
         
     def init(self, engine):
         """
@@ -43,7 +112,24 @@ class FutuParser(BaseExtParser):
             engine: WtEngine实例
         """
         super().init(engine)
-        self.__logger__.info(f"富途数据解析器 {self.id()} 初始化完成")
+        self.__push_quote__ = self._bind_push_quote(engine)
+        self._log.info("富途数据解析器 %s 初始化完成", self.id())
+        
+    def _bind_push_quote(self, engine):
+        """
+        绑定向引擎推送tick的函数，调用方式为push(POINTER(WTSTickStruct), uProcFlag)
+        解析器ID在绑定时传入，每次推送不再查找引擎的方法
+        
+        Args:
+            engine: WtEngine实例
+            
+        Returns:
+            推送函数，没有引擎时返回None
+        """
+        if engine is None:
+            return None
+            
+        return partial(engine.push_quote_from_extended_parser, self.id())
         
     def connect(self):
         """
@@ -59,13 +145,13 @@ class FutuParser(BaseExtParser):
             ret, data = self.__quote_ctx__.get_market_state([Market.HK, Market.US])
             if ret == RET_OK:
                 self.__is_connected__ = True
-                self.__logger__.info(f"富途OpenD连接成功: {self.__host__}:{self.__port__}")
-                self.__logger__.info(f"市场状态: {data}")
+                self._log.info("富途OpenD连接成功: %s:%s", self.__host__, self.__port__)
+                self._log.info("市场状态: %s", data)
             else:
-                self.__logger__.error(f"获取市场状态失败: {data}")
+                self._log.error("获取市场状态失败: %s", data)
                 
         except Exception as e:
-            self.__logger__.error(f"连接富途OpenD失败: {e}")
+            self._log.error("连接富途OpenD失败: %s", e)
             self.__is_connected__ = False
             
     def disconnect(self):
@@ -74,22 +160,22 @@ class FutuParser(BaseExtParser):
         """
         if self.__quote_ctx__:
             try:
-                # 取消所有订阅
-                for futu_code in self.__subscribed_codes__.copy():
-                    self.__quote_ctx__.unsubscribe(futu_code, [SubType.QUOTE])
+                # 分批取消所有订阅，取消失败的代码保留在订阅列表中
+                if self.__code_mapping__:
+                    self.unsubscribe(list(self.__code_mapping__))
                     
                 self.__quote_ctx__.close()
                 self.__is_connected__ = False
-                self.__logger__.info("富途OpenD连接已断开")
+                self._log.info("富途OpenD连接已断开")
             except Exception as e:
-                self.__logger__.error(f"断开连接时发生错误: {e}")
+                self._log.error("断开连接时发生错误: %s", e)
                 
     def release(self):
         """
         释放资源
         """
         self.disconnect()
-        self.__logger__.info("富途数据解析器资源已释放")
+        self._log.info("富途数据解析器资源已释放")
         
     def subscribe(self, fullCode: str):
         """
@@ -99,78 +185,119 @@ class FutuParser(BaseExtParser):
             fullCode: wtpy格式的合约代码，如 HK.00700 或 US.AAPL
         """
         if not self.__is_connected__:
-            self.__logger__.warning("未连接到富途OpenD，无法订阅")
+            self._log.warning("未连接到富途OpenD，无法订阅")
             return
             
         try:
-            futu_code = self._convert_to_futu_code(fullCode)
-            if not futu_code:
-                self.__logger__.error(f"无法转换代码格式: {fullCode}")
+            # 代码必须是"市场.代码"格式，只按第一个点拆分，代码本身可以带点，如 US.BRK.B
+            exchg, _, code = fullCode.partition('.')
+            if not exchg or not code:
+                self._log.error("代码格式错误，应为 市场.代码: %s", fullCode)
                 return
                 
+            # 富途和wtpy的代码格式一致，如 HK.00700 或 US.AAPL
+            futu_code = fullCode
             ret, err_msg = self.__quote_ctx__.subscribe(futu_code, [SubType.QUOTE])
             if ret == RET_OK:
-                self.__subscribed_codes__.add(futu_code)
                 self.__code_mapping__[fullCode] = futu_code
-                self.__logger__.info(f"订阅成功: {fullCode} -> {futu_code}")
+                self.__code_bytes__[futu_code] = (exchg.encode('UTF8'), code.encode('UTF8'))
+                self._rebuild_code_table()
+                self._log.info("订阅成功: %s -> %s", fullCode, futu_code)
             else:
-                self.__logger__.error(f"订阅失败: {fullCode}, 错误: {err_msg}")
+                self._log.error("订阅失败: %s, 错误: %s", fullCode, err_msg)
                 
         except Exception as e:
-            self.__logger__.error(f"订阅时发生错误: {e}")
+            self._log.error("订阅时发生错误: %s", e)
             
-    def unsubscribe(self, fullCode: str):
+    def unsubscribe(self, fullCode: Union[str, List[str]]):
         """
-        取消订阅
+        取消订阅，传入多个代码时按FUTU_BATCH_SIZE合并请求
         
         Args:
-            fullCode: wtpy格式的合约代码
+            fullCode: wtpy格式的合约代码，或合约代码列表
         """
         if not self.__is_connected__:
             return
             
-        try:
-            if fullCode in self.__code_mapping__:
-                futu_code = self.__code_mapping__[fullCode]
-                ret, err_msg = self.__quote_ctx__.unsubscribe(futu_code, [SubType.QUOTE])
-                if ret == RET_OK:
-                    self.__subscribed_codes__.discard(futu_code)
-                    del self.__code_mapping__[fullCode]
-                    self.__logger__.info(f"取消订阅成功: {fullCode}")
-                else:
-                    self.__logger__.error(f"取消订阅失败: {fullCode}, 错误: {err_msg}")
-                    
-        except Exception as e:
-            self.__logger__.error(f"取消订阅时发生错误: {e}")
+        full_codes = [fullCode] if isinstance(fullCode, str) else fullCode
+        full_codes = [code for code in full_codes if code in self.__code_mapping__]
+        if not full_codes:
+            return
+            
+        # 按富途接口的上限分批请求，每批单独检查结果，失败的代码保留在订阅列表中
+        for i in range(0, len(full_codes), FUTU_BATCH_SIZE):
+            batch = full_codes[i:i + FUTU_BATCH_SIZE]
+            futu_codes = [self.__code_mapping__[code] for code in batch]
+            try:
+                ret, err_msg = self.__quote_ctx__.unsubscribe(futu_codes, [SubType.QUOTE])
+            except Exception as e:
+                ret, err_msg = RET_ERROR, e
+            if ret == RET_OK:
+                for code, futu_code in zip(batch, futu_codes):
+                    del self.__code_mapping__[code]
+                    self.__code_bytes__.pop(futu_code, None)
+                self._log.info("取消订阅成功: %s", batch)
+            else:
+                self._log.error("取消订阅失败: %s, 错误: %s", batch, err_msg)
+        self._rebuild_code_table()
             
-    def _convert_to_futu_code(self, wtpy_code: str) -> str:
+    def _local_stamp(self):
+        """
+        取当前本地时间的日期和时间，同一秒内只计算一次
+        
+        Returns:
+            (YYYYMMDD, HHMMSSmmm)，毫秒部分为0
         """
-        将wtpy格式代码转换为富途格式
+        sec = int(time.time())
+        if sec != self.__stamp_sec__:
+            now = time.localtime(sec)
+            self.__stamp__ = (now.tm_year * 10000 + now.tm_mon * 100 + now.tm_mday,
+                              (now.tm_hour * 10000 + now.tm_min * 100 + now.tm_sec) * 1000)
+            self.__stamp_sec__ = sec
+        return self.__stamp__
+        
+    def _alloc_ticks(self, n: int):
+        """
+        从复用的缓冲区中取出n条WTSTickStruct
+        每次回调都会写入同一组字段，其余字段始终为0，因此不需要清零
         
         Args:
-            wtpy_code: wtpy格式代码，如 HK.00700 或 US.AAPL
+            n: tick条数
             
         Returns:
-            富途格式代码，如 HK.00700 或 US.AAPL
+            (WTSTickStruct缓冲区, 前n条的numpy视图)
         """
-        # 富途和wtpy的代码格式基本一致，直接返回
-        return wtpy_code
+        if self.__tick_buf_cap__ < n:
+            self.__tick_buf_cap__ = n * 2
+            self.__tick_buf__ = (WTSTickStruct * self.__tick_buf_cap__)()
+        return self.__tick_buf__, np.frombuffer(self.__tick_buf__, dtype=NpTypeTick, count=n)
         
-    def _convert_to_wtpy_code(self, futu_code: str) -> str:
+    def _schema_plan(self, columns: tuple) -> Tuple[tuple, tuple]:
         """
-        将富途格式代码转换为wtpy格式
+        取得某种列组合的填充方案，结果按列组合缓存
         
         Args:
-            futu_code: 富途格式代码
+            columns: 行情数据的列名
             
         Returns:
-            wtpy格式代码
+            ((富途列, tick字段), ...)和缺少对应列、需要填0的tick字段
+        """
+        plan = self.__schema_plans__.get(columns)
+        if plan is None:
+            present = set(columns)
+            plan = (tuple((col, field) for col, field in _QUOTE_FIELDS if col in present),
+                    tuple(field for col, field in _QUOTE_FIELDS if col not in present))
+            self.__schema_plans__[columns] = plan
+        return plan
+        
+    def _rebuild_code_table(self):
+        """
+        订阅变化后重建代码查找表
         """
-        # 查找映射表中的wtpy代码
-        for wtpy_code, mapped_futu_code in self.__code_mapping__.items():
-            if mapped_futu_code == futu_code:
-                return wtpy_code
-        return futu_code
+        pairs = list(self.__code_bytes__.values())
+        self.__code_index__ = pd.Index(list(self.__code_bytes__), dtype=object)
+        self.__exchg_table__ = np.array([exchg for exchg, _ in pairs], dtype=NpTypeTick['exchg'])
+        self.__code_table__ = np.array([code for _, code in pairs], dtype=NpTypeTick['code'])
         
     def _on_quote_callback(self, data):
         """
@@ -180,52 +307,58 @@ class FutuParser(BaseExtParser):
             data: 富途行情数据
         """
         try:
-            if data is None or data.empty:
+            if data is None:
+                return
+            total = len(data)
+            if total == 0:
                 return
                 
-            for _, row in data.iterrows():
-                # 创建wtpy tick结构
-                tick = WTSTickStruct()
-                
-                # 转换代码格式
-                wtpy_code = self._convert_to_wtpy_code(row['code'])
-                code_parts = wtpy_code.split('.')
-                if len(code_parts) >= 2:
-                    tick.exchg = bytes(code_parts[0], encoding="UTF8")
-                    tick.code = bytes(code_parts[1], encoding="UTF8")
-                else:
-                    continue
-                    
-                # 填充价格数据
-                tick.price = float(row.get('last_price', 0))
-                tick.open = float(row.get('open_price', 0))
-                tick.high = float(row.get('high_price', 0))
-                tick.low = float(row.get('low_price', 0))
-                tick.settle = float(row.get('prev_close_price', 0))
-                
-                # 填充成交量和成交额
-                tick.total_volume = int(row.get('volume', 0))
-                tick.total_turnover = float(row.get('turnover', 0))
+            # 只保留已订阅且有最新价（非NaN、非0）的行，未订阅的代码在查找表中的位置为-1
+            slots = self.__code_index__.get_indexer(data['code'])
+            last = _column(data, 'last_price', np.float64)
+            keep = (slots >= 0) & (last == last) & (last != 0.0)
+            rows = np.flatnonzero(keep)
+            n = len(rows)
+            if n == 0:
+                return
                 
-                # 填充买卖盘数据
-                tick.bid_prices = [float(row.get('bid_price', 0))]
-                tick.ask_prices = [float(row.get('ask_price', 0))]
-                tick.bid_qty = [int(row.get('bid_vol', 0))]
-                tick.ask_qty = [int(row.get('ask_vol', 0))]
+            # 全部行都保留时（通常如此）直接使用整列视图，不再按下标复制
+            if n == total:
+                rows = slice(None)
                 
-                # 填充时间戳
-                tick.action_date = int(time.strftime('%Y%m%d'))
-                tick.action_time = int(time.strftime('%H%M%S')) * 1000
-                tick.trading_date = tick.action_date
+            # 用与WTSTickStruct内存布局一致的numpy视图按列整体填充
+            # 各列按原始类型直接赋值，转换为double在写入字段时一次完成
+            buffer, ticks = self._alloc_ticks(n)
+            slots = slots[rows]
+            ticks['exchg'] = self.__exchg_table__[slots]
+            ticks['code'] = self.__code_table__[slots]
+            ticks['price'] = last[rows]
+            fields, missing = self._schema_plan(tuple(data.columns))
+            for col, field in fields:
+                ticks[field] = data[col].to_numpy()[rows]
+            for field in missing:
+                ticks[field] = 0.0
                 
-                # 推送到引擎
-                if hasattr(self, '_BaseExtParser__engine__') and self._BaseExtParser__engine__:
-                    self._BaseExtParser__engine__.push_quote_from_extended_parser(
-                        self.id(), byref(tick), True
-                    )
-                    
+            # 同一批行情使用同一个本地时间戳
+            action_date, action_time = self._local_stamp()
+            ticks['action_date'] = action_date
+            ticks['action_time'] = action_time
+            ticks['trading_date'] = action_date
+            
+        except Exception as e:
+            _LOG.error("[%s] 转换行情数据时发生错误: %s", self.id(), e)
+            return
+            
+        # 推送到引擎，循环中用到的函数先绑定到局部变量
+        push = self.__push_quote__
+        if push is None:
+            return
+        ref = byref
+        try:
+            for offset in range(0, n * TICK_SIZE, TICK_SIZE):
+                push(ref(buffer, offset), True)
         except Exception as e:
-            self.__logger__.error(f"处理行情回调时发生错误: {e}")
+            _LOG.error("[%s] 推送行情时发生错误: %s", self.id(), e)
 
 class StockQuoteHandlerBase:
     """
@@ -2,5 +2,6 @@
 from .FutuParser import FutuParser
 from .FutuExecuter import FutuExecuter
 from .FutuDataLoader import FutuDataLoader
+from .CachedFutuDataLoader import CachedFutuDataLoader
 
-__all__ = ['FutuParser', 'FutuExecuter', 'FutuDataLoader']
\ No newline at end of file
+__all__ = ['FutuParser', 'FutuExecuter', 'FutuDataLoader', 'CachedFutuDataLoader']
\ No newline at end of file